@@ -0,0 +1,199 @@
+import os
+import asyncio
+import logging
+import zipfile
+import tempfile
+import posixpath
+
+import formats
+from executor import JobExecutor, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSION = ".zip"
+# Documents one archive may hold; larger sets are refused before anything is processed
+MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", "500"))
+# Uncompressed size allowed per document, checked while it is extracted (declared sizes can lie)
+MAX_MEMBER_BYTES = int(os.getenv("ZIP_MAX_MEMBER_BYTES", str(64 * 1024 * 1024)))
+# Documents of one archive processed at the same time (0 = as many as there are free job slots). The
+# first runs on the archive's own job slot; every other one claims a free slot from the scheduler.
+CONCURRENCY = int(os.getenv("ZIP_CONCURRENCY", "0"))
+# Reason listed for the documents left out because the worker pool was full
+BUSY_REASON = "the bot was busy, please send it again later"
+# Bytes copied at a time when extracting a member
+COPY_BLOCK = 1024 * 1024
+
+# Raised for archives that can't be processed; the message is shown to the user
+class ArchiveError(Exception):
+    pass
+
+def is_archive(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() == ARCHIVE_EXTENSION
+
+# Name of the processed archive sent back to the user
+def output_name(name: str) -> str:
+    return f"processed_{name}"
+
+# The members to process (every file in a supported format) and the number of other files, which are
+# left out of the result. Folders, macOS metadata and encrypted members are never processed.
+def archive_members(archive: zipfile.ZipFile) -> tuple:
+    members = []
+    skipped = 0
+    for info in archive.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or posixpath.basename(info.filename).startswith("."):
+            continue
+        if info.flag_bits & 0x1 or formats.adapter_for(info.filename) is None:
+            skipped += 1
+            continue
+        members.append(info)
+    if not members:
+        raise ArchiveError(f"The archive has no documents in a supported format ({formats.SUPPORTED}).")
+    if len(members) > MAX_MEMBERS:
+        raise ArchiveError(f"The archive has {len(members)} documents. The limit is {MAX_MEMBERS} per archive.")
+    return members, skipped
+
+# Copy one member to `path` a block at a time, so memory use doesn't depend on the member's size
+def extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, path: str) -> None:
+    copied = 0
+    with archive.open(info) as source, open(path, "wb") as target:
+        for block in iter(lambda: source.read(COPY_BLOCK), b""):
+            copied += len(block)
+            if copied > MAX_MEMBER_BYTES:
+                raise ArchiveError(f"larger than {MAX_MEMBER_BYTES / (1024 * 1024):.0f} MB uncompressed")
+            target.write(block)
+
+# Rewrite every supported document of the ZIP file at `source` into a ZIP file at `output`, under the
+# name the single-document path would give it (in the same folder). A few documents are in flight at a
+# time: each is extracted to a temp file, processed on disk in the worker pool (formats.process_file,
+# the same path as a large single upload) and appended to the output as soon as it is done, so memory
+# and temp space stay bounded whatever the size of the archive. Documents that fail are left out and
+# listed in stats["failed"] as (name, error); the per-document statistics are in stats["documents"].
+# `progress(done, total)` is awaited before the first document and after each one.
+# One document always runs on the archive's own job slot. `claim()` returns an extra slot (a scheduler
+# ticket, see FairScheduler.claim) or None when none is free; each further document in flight holds
+# one, so the archive only uses workers the scheduler has counted. When the worker pool is full, the
+# documents not yet done are listed as failed and the ones already written are kept.
+async def process_archive(
+    source: str,
+    output: str,
+    executor: JobExecutor,
+    seed: int = None,
+    target: float = None,
+    progress=None,
+    claim=None,
+) -> dict:
+    try:
+        archive = await asyncio.to_thread(zipfile.ZipFile, source)
+    except zipfile.BadZipFile:
+        raise ArchiveError("This file isn't a valid ZIP archive.")
+
+    with archive, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as result:
+        members, skipped = archive_members(archive)
+        stats = {"documents": [], "failed": [], "skipped": skipped}
+        # Appending to the output ZIP isn't thread-safe, so one document is written at a time
+        write_lock = asyncio.Lock()
+        written = set()
+        busy = False
+        reported = None
+
+        async def report() -> None:
+            nonlocal reported
+            done = len(stats["documents"]) + len(stats["failed"])
+            if progress is not None and done != reported:
+                reported = done
+                await progress(done, len(members))
+
+        async def process(info: zipfile.ZipInfo) -> None:
+            nonlocal busy
+            try:
+                document_stats = await _process_member(archive, info, result, write_lock, written, executor, seed, target)
+            except QueueFullError:
+                busy = True
+                stats["failed"].append((info.filename, BUSY_REASON))
+            except Exception as e:
+                logger.warning("Failed to process %s from an archive: %s", info.filename, e)
+                stats["failed"].append((info.filename, str(e)))
+            else:
+                stats["documents"].append((info.filename, document_stats))
+            await report()
+
+        # Extra slots are released when their document is done; the archive's own slot (None) is just reused
+        async def run(info: zipfile.ZipInfo, slot) -> None:
+            if slot is None:
+                await process(info)
+            else:
+                async with slot:
+                    await process(info)
+
+        await report()
+        in_flight = {}
+        try:
+            for info in members:
+                while not busy:
+                    # Forget the documents that are done (result() re-raises anything that escaped them)
+                    for task in [task for task in in_flight if task.done()]:
+                        del in_flight[task]
+                        task.result()
+                    if None not in in_flight.values():
+                        slot = None
+                        break
+                    slot = claim() if claim is not None and (not CONCURRENCY or len(in_flight) < CONCURRENCY) else None
+                    if slot is not None:
+                        break
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                if busy:
+                    stats["failed"].append((info.filename, BUSY_REASON))
+                    continue
+                in_flight[asyncio.create_task(run(info, slot))] = slot
+            await asyncio.gather(*in_flight)
+        finally:
+            # Cancelled (the user's job was dropped): stop the documents in flight, which frees their slots
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        # Documents left out after the pool filled up are only counted now
+        await report()
+
+    return stats
+
+# Extract, process and store one member (`written` holds the names used in the output so far);
+# returns its statistics
+async def _process_member(
+    archive: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    result: zipfile.ZipFile,
+    write_lock: asyncio.Lock,
+    written: set,
+    executor: JobExecutor,
+    seed: int = None,
+    target: float = None,
+) -> dict:
+    directory, name = posixpath.split(info.filename)
+    processed_name = formats.output_name(name)
+    extension = os.path.splitext(name)[1].lower()
+    fd, file_path = tempfile.mkstemp(prefix="aibot_zip_", suffix=extension)
+    os.close(fd)
+    processed_file_path = file_path[:-len(extension)] + "_processed" + os.path.splitext(processed_name)[1]
+
+    try:
+        await asyncio.to_thread(extract_member, archive, info, file_path)
+        # Without a seed each document gets its own, derived from its content as for single uploads
+        document_stats = await executor.run(
+            formats.process_file, file_path, processed_file_path, name, seed, None, None, target
+        )
+        async with write_lock:
+            # Two documents can map to the same name ("notes.md" and "notes.txt"); number the later ones
+            arcname = posixpath.join(directory, processed_name)
+            stem, suffix = posixpath.splitext(arcname)
+            number = 1
+            while arcname in written:
+                number += 1
+                arcname = f"{stem} ({number}){suffix}"
+            written.add(arcname)
+            await asyncio.to_thread(result.write, processed_file_path, arcname)
+        return document_stats
+
+    finally:
+        for path in (file_path, processed_file_path):
+            if os.path.exists(path):
+                os.remove(path)
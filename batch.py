@@ -0,0 +1,154 @@
+import re
+import numpy as np
+
+from lexicon import get_lexicon, POS_TAGS, ANY, AFTER_WORD, BEFORE_WORD
+from tokenizer import WORD_RE, match_case, sentence_spans
+from reorder import ReorderPipeline
+
+# Splitting on a capturing word pattern gives [separator, word, separator, ..., word, separator]
+SPLIT_RE = re.compile(f"({WORD_RE.pattern})")
+
+# Rewrite many texts in one call. Follows the same rules as rewriter.rewrite_text, but the words
+# of the whole batch are interned to integer IDs, lexicon lookups are array lookups over those
+# IDs, the context-dependent candidate is picked with array lookups into the lexicon's precomputed
+# table, and the replace/reorder decisions are drawn as NumPy arrays at once. Python-level work
+# is limited to the words that actually get replaced and the sentences that get reordered.
+def rewrite_batch(
+    texts: list,
+    rng: np.random.Generator,
+    replace_probability: float,
+    reorder_probability: float,
+    reorder: ReorderPipeline,
+    stats: dict = None,
+) -> list:
+    lexicon = get_lexicon()
+
+    # Split every text into sentences the way rewrite_text does, keeping the offsets to put them back
+    sentences = []
+    spans = []
+    for text in texts:
+        text_spans = sentence_spans(text)
+        sentences.extend(text[start:end] for start, end in text_spans)
+        spans.append(text_spans)
+
+    # Tokenize: the regex split runs in C; words sit at the odd indices of each sentence's pieces
+    pieces = [SPLIT_RE.split(sentence) for sentence in sentences]
+    word_counts = np.fromiter((len(p) // 2 for p in pieces), dtype=np.int64, count=len(pieces))
+    first_word = np.concatenate(([0], np.cumsum(word_counts)))
+    words = [word for p in pieces for word in p[1::2]]
+
+    # Intern the lower-cased words: ids[i] indexes into vocab
+    if words:
+        vocab, ids = np.unique(np.array("\0".join(words).lower().split("\0")), return_inverse=True)
+        vocab = vocab.tolist()
+    else:
+        vocab, ids = [], np.empty(0, dtype=np.int64)
+
+    # Per-vocabulary lookup tables, then one array lookup for every token
+    table = np.array([lexicon.ids.get(w, -1) for w in vocab], dtype=np.int64)
+    starts_phrase = np.array([w in lexicon.phrases for w in vocab], dtype=bool)
+    unit_entry = table[ids] if len(vocab) else np.empty(0, dtype=np.int64)
+    unit_length = np.ones(len(words), dtype=np.int64)
+    is_unit = np.ones(len(words), dtype=bool)
+    sentence_of = np.repeat(np.arange(len(sentences)), word_counts)
+
+    # Multi-word phrases: only words that can start a phrase are checked against the trie
+    for position in np.flatnonzero(starts_phrase[ids]).tolist() if len(vocab) else []:
+        if not is_unit[position]:
+            continue
+        index = int(sentence_of[position])
+        p = pieces[index]
+        local = position - int(first_word[index])
+        node = lexicon.phrases[vocab[ids[position]]]
+        length = 0
+        j = local
+        while node is not None:
+            if None in node and j > local:
+                length = j - local + 1
+                phrase_entry = node[None]
+            # The next word must be in the same sentence and joined by plain whitespace
+            if 2 * j + 3 >= len(p) or not p[2 * j + 2].isspace():
+                break
+            j += 1
+            node = node.get(p[2 * j + 1].lower())
+        if length:
+            unit_entry[position] = phrase_entry
+            unit_length[position] = length
+            is_unit[position + 1:position + length] = False
+
+    # Context: the words either side of each unit, when joined to it by plain whitespace
+    # (joined[k] says word k and word k + 1 are in the same sentence with only whitespace between)
+    # (the separators between a sentence's words, then "" after its last word)
+    gaps = [separator for p in pieces if len(p) > 1 for separator in p[2:len(p) - 1:2] + [""]]
+    joined = np.fromiter(map(str.isspace, gaps), dtype=bool, count=len(words))
+    positions = np.arange(len(words))
+    has_previous = np.zeros(len(words), dtype=bool)
+    has_previous[1:] = joined[:-1]
+    last = positions + unit_length - 1
+    has_following = joined[last] if len(words) else np.zeros(0, dtype=bool)
+    following = np.minimum(last + 1, max(len(words) - 1, 0))
+
+    # Part-of-speech hint from the neighbours, then the precomputed best candidate per (entry, hint)
+    after_hint = np.array([AFTER_WORD.get(w, ANY) for w in vocab], dtype=np.int64)
+    before_hint = np.array([BEFORE_WORD.get(w, ANY) for w in vocab], dtype=np.int64)
+    hint = np.full(len(words), ANY, dtype=np.int64)
+    if len(vocab):
+        hint[has_previous] = after_hint[ids[positions[has_previous] - 1]]
+        use_following = (hint == ANY) & has_following
+        hint[use_following] = before_hint[ids[following[use_following]]]
+    best = np.frombuffer(lexicon.best, dtype=np.int32)
+    in_lexicon = is_unit & (unit_entry >= 0)
+    unit_replacement = np.full(len(words), -1, dtype=np.int64)
+    unit_replacement[in_lexicon] = best[unit_entry[in_lexicon] * len(POS_TAGS) + hint[in_lexicon]]
+
+    # Cue words override the hint; they are rare, so the few units next to one are handled one by one
+    if lexicon.cues and len(vocab):
+        is_cue = np.array([w in lexicon.cues for w in vocab], dtype=bool)
+        near_cue = in_lexicon & (
+            (has_previous & is_cue[ids[np.maximum(positions - 1, 0)]]) | (has_following & is_cue[ids[following]])
+        )
+        for position in np.flatnonzero(near_cue).tolist():
+            previous = vocab[ids[position - 1]] if has_previous[position] else None
+            after = vocab[ids[following[position]]] if has_following[position] else None
+            unit_replacement[position] = lexicon.choose_id(int(unit_entry[position]), previous, after)
+
+    # The replace and reorder decisions for the whole batch in two draws
+    replace = is_unit & (unit_replacement >= 0) & (rng.random(len(words)) < replace_probability)
+    reordered = rng.random(len(sentences)) < reorder_probability
+
+    if stats is not None:
+        stats["words"] = stats.get("words", 0) + int(is_unit.sum())
+        stats["words_replaced"] = stats.get("words_replaced", 0) + int(replace.sum())
+
+    rewritten = ["".join(p) for p in pieces]
+
+    # Patch just the replaced words of each sentence
+    replaced_positions = np.flatnonzero(replace)
+    for position, index in zip(replaced_positions.tolist(), sentence_of[replaced_positions].tolist()):
+        p = pieces[index]
+        local = 2 * (position - int(first_word[index])) + 1
+        length = int(unit_length[position])
+        original = "".join(p[local:local + 2 * length - 1])
+        p[local] = match_case(original, lexicon.strings[unit_replacement[position]])
+        p[local + 1:local + 2 * length - 1] = [""] * (2 * length - 2)
+    for index in np.unique(sentence_of[replaced_positions]).tolist():
+        rewritten[index] = "".join(pieces[index])
+
+    # Restructure the sentences picked for reordering, after their words were replaced
+    for index in np.flatnonzero(reordered).tolist():
+        rewritten[index] = reorder.apply(rewritten[index], rng, stats)
+
+    # Regroup sentences into their texts, between the original separators
+    results = []
+    index = 0
+    for text, text_spans in zip(texts, spans):
+        out = []
+        position = 0
+        for start, end in text_spans:
+            out.append(text[position:start])
+            out.append(rewritten[index])
+            index += 1
+            position = end
+        out.append(text[position:])
+        results.append("".join(out))
+    return results
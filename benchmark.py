@@ -0,0 +1,299 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Benchmark the rewrite pipeline offline on synthetic documents (no Telegram needed):
+#   python benchmark.py --pages 1 10 100 1000 --output results.json
+#   python benchmark.py --compare results.json   # exit 1 if any stage got slower
+#   python benchmark.py --pages --startup --startup-budget 0.5   # bot startup only; exit 1 over budget
+
+WORDS_PER_PAGE = 500
+WORDS_PER_PARAGRAPH = 100
+
+FILLER = (
+    "the of and to in a is that for it as was with be by on not this are or from at which but have an "
+    "they more one all their has been would there were can its also these than other only some into most"
+).split()
+
+# Generate a .docx of roughly `pages` pages, split into many small runs like Word produces
+def generate_docx(pages: int, seed: int = 0) -> bytes:
+    from docx import Document
+    from lexicon import get_lexicon
+
+    rng = random.Random(seed)
+    vocabulary = [word for word in get_lexicon().ids if " " not in word]
+    doc = Document()
+
+    for p in range(pages * WORDS_PER_PAGE // WORDS_PER_PARAGRAPH):
+        if p % 20 == 0:
+            doc.add_heading(" ".join(rng.choice(vocabulary) for _ in range(4)).title(), level=2)
+
+        # A paragraph of sentences mixing lexicon words with filler and punctuation
+        words = []
+        for i in range(WORDS_PER_PARAGRAPH):
+            word = rng.choice(vocabulary) if rng.random() < 0.3 else rng.choice(FILLER)
+            if not words or words[-1].endswith("."):
+                word = word.capitalize()
+            if rng.random() < 0.08:
+                word += rng.choice((".", ".", ",", ";", "?"))
+            words.append(word)
+        text = " ".join(words) + "."
+
+        # Split into runs of 1-12 words, sometimes mid-word (spell-check/revision fragments)
+        para = doc.add_paragraph()
+        position = 0
+        while position < len(text):
+            end = text.find(" ", position + rng.randint(1, 60))
+            end = len(text) if end == -1 else end + 1
+            if rng.random() < 0.1:
+                end = min(len(text), position + rng.randint(1, 8))
+            run = para.add_run(text[position:end])
+            run.bold = rng.random() < 0.1
+            run.italic = rng.random() < 0.1
+            position = end
+
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+# Best-of-n wall time of fn()
+def timed(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Time every stage on one document; runs in a fresh process so peak RSS belongs to this size only
+def bench_document(path: str, repeat: int, seed: int) -> dict:
+    import rewriter
+    from traversal import open_document, iter_text_nodes
+    from tokenizer import sentence_spans
+    from reorder import ReorderPipeline, REORDER_STRATEGIES
+    from fingerprints import group_paragraphs
+    from similarity import score_paragraphs
+
+    lexicon = rewriter.get_lexicon()
+    with open(path, "rb") as f:
+        data = f.read()
+
+    doc = open_document(io.BytesIO(data))
+    nodes = list(iter_text_nodes(doc))
+    texts = [node.text or "" for node in nodes]
+    paragraphs = ["".join(texts[i] for i in indices) for indices in group_paragraphs(nodes)]
+    rewritten_paragraphs = rewriter.rewrite_texts(paragraphs, seed=seed, workers=1)
+    words = [word for text in texts for word in text.split()]
+    sentences = [text[start:end] for text in texts for start, end in sentence_spans(text)]
+
+    def rewrite_texts():
+        rewriter.rewrite_texts(texts, seed=seed, workers=1)
+
+    def rewrite_batch():
+        rewriter.BATCH = True
+        try:
+            rewriter.rewrite_texts(texts, seed=seed, workers=1)
+        finally:
+            rewriter.BATCH = False
+
+    def rewrite_text():
+        rng = random.Random(seed)
+        for text in texts:
+            rewriter.rewrite_text(text, rng=rng)
+
+    def rewrite_sentence():
+        rng = random.Random(seed)
+        for sentence in sentences:
+            rewriter.rewrite_sentence(sentence, rng=rng)
+
+    def segment():
+        for text in texts:
+            sentence_spans(text)
+
+    # Every sentence through one reorder strategy (as if each one were picked for reordering)
+    def reorder(name):
+        pipeline = ReorderPipeline((name,))
+        rng = random.Random(seed)
+        for sentence in sentences:
+            pipeline.apply(sentence, rng)
+
+    def get_synonym():
+        for word in words:
+            rewriter.get_synonym(word)
+
+    def score():
+        score_paragraphs(paragraphs, rewritten_paragraphs)
+
+    def save():
+        doc.save(io.BytesIO())
+
+    stages = {
+        "segment": timed(segment, repeat),
+        **{f"reorder_{name}": timed(lambda: reorder(name), repeat) for name in REORDER_STRATEGIES},
+        "get_synonym": timed(get_synonym, repeat),
+        "rewrite_sentence": timed(rewrite_sentence, repeat),
+        "rewrite_text": timed(rewrite_text, repeat),
+        "rewrite_texts": timed(rewrite_texts, repeat),
+        "rewrite_batch": timed(rewrite_batch, repeat),
+        "score": timed(score, repeat),
+        "parse": timed(lambda: open_document(io.BytesIO(data)), repeat),
+        "save": timed(save, repeat),
+        "process_docx": timed(lambda: rewriter.process_docx(io.BytesIO(data), io.BytesIO(), seed=seed, workers=1), repeat),
+        "process_docx_xml": timed(lambda: rewriter.process_docx_xml(io.BytesIO(data), io.BytesIO(), seed=seed, workers=1), repeat),
+    }
+
+    return {
+        "bytes": len(data),
+        "runs": len(texts),
+        "words": len(words),
+        "lexicon_entries": len(lexicon),
+        "stages": stages,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+# Runs in a fresh interpreter: imports the bot, runs main() until it would start polling Telegram, then
+# rewrites one document so the cost that startup defers shows up too. Prints the timings as JSON.
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import os, sys, json, asyncio
+os.environ.update(TELEGRAM_BOT_TOKEN="0:benchmark", BOT_MODE="polling", METRICS_PORT="0", PREWARM="0")
+import plagiarism_bot
+imported = time.perf_counter()
+ready = []
+
+async def run_polling(self, *args, **kwargs):
+    ready.append(time.perf_counter())
+
+plagiarism_bot.Application.run_polling = run_polling
+asyncio.run(plagiarism_bot.main())
+with open(sys.argv[1], "rb") as f:
+    data = f.read()
+first = time.perf_counter()
+plagiarism_bot.formats.process_bytes(data, "benchmark.docx", 0)
+done = time.perf_counter()
+print(json.dumps({"import": imported - started, "ready": ready[0] - started, "first_document": done - first}))
+"""
+
+# Best-of-n startup timings of the bot, each in a new process: "import" (importing plagiarism_bot),
+# "ready" (until main() starts polling), "first_document" (rewriting a document right after) and
+# "process" (wall time including interpreter startup)
+def bench_startup(path: str, repeat: int) -> dict:
+    best = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, os.path.abspath(path)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True, capture_output=True, text=True,
+        ).stdout
+        timings = dict(json.loads(output.splitlines()[-1]), process=time.perf_counter() - started)
+        best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in timings.items()}
+    return best
+
+# Load a generated corpus file, creating it on first use
+def corpus_file(corpus_dir: str, pages: int, seed: int) -> str:
+    path = os.path.join(corpus_dir, f"synthetic_{pages}p_seed{seed}.docx")
+    if not os.path.exists(path):
+        os.makedirs(corpus_dir, exist_ok=True)
+        data = generate_docx(pages, seed)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return path
+
+def run(pages_list: list, repeat: int, seed: int, corpus_dir: str, startup: bool = False) -> dict:
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for pages in pages_list:
+        path = corpus_file(corpus_dir, pages, seed)
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            result = pool.submit(bench_document, path, repeat, seed).result()
+        result["pages"] = pages
+        results.append(result)
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in result["stages"].items())
+        print(f"{pages:>5} pages ({result['runs']} runs): {stages}, peak {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+    startup_result = None
+    if startup:
+        startup_result = bench_startup(corpus_file(corpus_dir, 1, seed), repeat)
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in startup_result.items())
+        print(f"startup: {stages}", file=sys.stderr)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+        "startup": startup_result,
+    }
+
+# Stages that got slower than the baseline by more than `tolerance` (as a fraction)
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    previous = {result["pages"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["pages"])
+        if old is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            old_seconds = old["stages"].get(stage)
+            if old_seconds and seconds > old_seconds * (1 + tolerance):
+                regressions.append((result["pages"], stage, old_seconds, seconds))
+    for stage, seconds in (current.get("startup") or {}).items():
+        old_seconds = (baseline.get("startup") or {}).get(stage)
+        if old_seconds and seconds > old_seconds * (1 + tolerance):
+            regressions.append(("startup", stage, old_seconds, seconds))
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the rewrite pipeline on synthetic documents.")
+    parser.add_argument("--pages", type=int, nargs="*", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3, help="best-of-N timing per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=os.path.join("bench_corpus"))
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--startup", action="store_true", help="also time bot startup (import, time-to-ready, first document)")
+    parser.add_argument("--startup-budget", type=float, help="seconds main() may take to become ready")
+    args = parser.parse_args()
+
+    results = run(args.pages, args.repeat, args.seed, args.corpus_dir, startup=args.startup or args.startup_budget is not None)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for pages, stage, old_seconds, seconds in regressions:
+            label = pages if pages == "startup" else f"{pages} pages"
+            print(f"REGRESSION {label} {stage}: {old_seconds * 1000:.1f}ms -> {seconds * 1000:.1f}ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+    if args.startup_budget is not None and results["startup"]["ready"] > args.startup_budget:
+        print(f"OVER BUDGET: ready after {results['startup']['ready']:.3f}s (budget {args.startup_budget:.3f}s)", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
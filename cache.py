@@ -0,0 +1,177 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Suffix of result files in the disk tier (results can be any output format, so it names none)
+RESULT_SUFFIX = ".result"
+
+# Content-addressed cache of processed documents: an in-memory LRU tier plus an optional on-disk tier.
+# Each result is kept with the statistics reported alongside it (similarity, overlaps), so a cache hit
+# gives the user the same reply as the original run. get and put are coroutines: the memory tier is
+# used on the event loop, and the disk tier's reads, writes and evictions run in threads.
+class ResultCache:
+    def __init__(self, max_bytes: int, max_entries: int, disk_dir: str = None, disk_max_bytes: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_bytes = 0
+        # Disk writes run in threads, one at a time
+        self.disk_lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+        self.hits = 0
+        self.misses = 0
+
+    # Build a cache from CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_DIR and CACHE_DISK_MAX_BYTES
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "256")),
+            disk_dir=os.getenv("CACHE_DIR") or None,
+            disk_max_bytes=int(os.getenv("CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))),
+        )
+
+    # Key a result on the input bytes plus everything that affects the output
+    @staticmethod
+    def make_key(data: bytes, settings: dict, seed=None) -> str:
+        h = hashlib.sha256(data)
+        h.update(json.dumps({"settings": settings, "seed": seed}, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    # The cached (result bytes, statistics) for a key, or None
+    async def get(self, key: str) -> tuple:
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        entry = await asyncio.to_thread(self._disk_get, key) if self.disk_dir else None
+        if entry is not None:
+            # Promote disk hits into memory
+            self._memory_put(key, *entry)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        return None
+
+    # Cache a result with its statistics (anything JSON can store)
+    async def put(self, key: str, value: bytes, stats: dict = None) -> None:
+        stats = stats or {}
+        self._memory_put(key, value, stats)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_put, key, value, stats)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+        }
+
+    def _memory_put(self, key: str, value: bytes, stats: dict) -> None:
+        # Results bigger than the whole budget are not kept in memory
+        if len(value) > self.max_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old[0])
+        self.memory[key] = (value, stats)
+        self.memory_bytes += len(value)
+
+        # Evict least recently used entries until both limits hold
+        while len(self.memory) > self.max_entries or self.memory_bytes > self.max_bytes:
+            _, (evicted, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + RESULT_SUFFIX)
+
+    # The statistics stored next to a result file
+    @staticmethod
+    def _stats_path(path: str) -> str:
+        return os.path.splitext(path)[0] + ".json"
+
+    # (path, size, last access) for every file in the disk tier
+    def _disk_entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(RESULT_SUFFIX):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _disk_get(self, key: str) -> tuple:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(self._stats_path(path), encoding="utf-8") as f:
+                stats = json.load(f)
+            with open(path, "rb") as f:
+                value = f.read()
+            # Touch the file so disk eviction is least-recently-used too
+            os.utime(path)
+            return value, stats
+        except (FileNotFoundError, ValueError):
+            # A missing or damaged file counts as a miss
+            return None
+
+    def _disk_put(self, key: str, value: bytes, stats: dict) -> None:
+        if not self.disk_dir or len(value) > self.disk_max_bytes:
+            return
+        # Writes from concurrent jobs take turns, so the same entry isn't written (and counted) twice
+        with self.disk_lock:
+            path = self._disk_path(key)
+            if os.path.exists(path) and os.path.exists(self._stats_path(path)):
+                return
+
+            # Write to temp names first so readers never see a partial file. The statistics go first:
+            # a result file without them is never read.
+            try:
+                for target, data in ((self._stats_path(path), json.dumps(stats).encode("utf-8")), (path, value)):
+                    tmp_path = f"{target}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, target)
+            except OSError as e:
+                logger.warning("Could not write cache file %s: %s", path, e)
+                return
+            self.disk_bytes += len(value)
+
+            if self.disk_bytes > self.disk_max_bytes:
+                # Remove the least recently used files until the disk tier fits again
+                for old_path, size, _ in sorted(self._disk_entries(), key=lambda e: e[2]):
+                    if self.disk_bytes <= self.disk_max_bytes:
+                        break
+                    try:
+                        os.remove(old_path)
+                        self.disk_bytes -= size
+                    except FileNotFoundError:
+                        pass
+                    try:
+                        os.remove(self._stats_path(old_path))
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import array
+import struct
+from functools import cached_property
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from lexicon import Lexicon, POS_TAGS
+
+# File suffix of compiled lexicons; LEXICON_PATH ending in it loads the file with CompiledLexicon
+COMPILED_SUFFIX = ".lex"
+
+MAGIC = b"AIBOTLEX"
+# Bumped when the format or the precomputed best-candidate table changes
+VERSION = 2
+# magic, version, byte order (0 little, 1 big), POS tag count, entries, candidates, strings, digest
+HEADER = struct.Struct("<8sHBBIII32s")
+# Sections follow a table of (offset, length) pairs, each starting on an 8-byte boundary
+SECTIONS = (
+    "key_offsets", "key_blob", "slots", "offsets", "candidate", "pos", "frequency", "best",
+    "string_offsets", "string_blob", "phrases", "cues",
+)
+SECTION = struct.Struct("<QQ")
+
+# Lookups remembered per process before the memo is cleared
+RECENT_LOOKUPS = 65536
+
+# Read-only table of UTF-8 strings stored back to back, with their start offsets (plus the end)
+class StringTable:
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+# Key -> entry number, answered from an open-addressing hash table in the file (CRC32 of the key,
+# linear probing, slots hold entry + 1 with 0 for empty). Lookups are O(1) and nothing is built
+# in memory when the file is opened.
+class KeyTable(Mapping):
+    def __init__(self, keys: StringTable, slots: memoryview) -> None:
+        self.keys = keys
+        self.slots = slots
+        self.mask = len(slots) - 1
+        # Results of recent lookups (-1 for misses). Documents repeat the same words, so most lookups
+        # are answered here at dict speed; the memo is cleared when full so it stays small.
+        self.recent = {}
+
+    def get(self, key: str, default=None):
+        entry = self.recent.get(key)
+        if entry is None:
+            if len(self.recent) >= RECENT_LOOKUPS:
+                self.recent.clear()
+            entry = self.recent[key] = self._lookup(key)
+        return default if entry < 0 else entry
+
+    def _lookup(self, key: str) -> int:
+        encoded = key.encode("utf-8")
+        slots, mask, offsets, blob = self.slots, self.mask, self.keys.offsets, self.keys.blob
+        position = zlib.crc32(encoded) & mask
+        while True:
+            entry = slots[position] - 1
+            if entry < 0 or blob[offsets[entry]:offsets[entry + 1]] == encoded:
+                return entry
+            position = (position + 1) & mask
+
+    def __getitem__(self, key: str) -> int:
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.get(key) is not None
+
+    def __iter__(self):
+        for index in range(len(self.keys)):
+            yield self.keys[index]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+# A lexicon compiled with write_compiled, opened with mmap. The tables are views straight into the
+# mapped file, so opening it takes milliseconds and every worker process shares one page-cache copy
+# instead of parsing and holding its own.
+class CompiledLexicon(Lexicon):
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, version, byteorder, pos_count, entries, candidates, strings, digest = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compiled lexicon (version {VERSION}); rebuild it with compiled_lexicon.py")
+        if byteorder != (sys.byteorder == "big") or pos_count != len(POS_TAGS):
+            raise ValueError(f"{path} was compiled on a different platform or version; rebuild it with compiled_lexicon.py")
+
+        sections = {}
+        for index, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(view, HEADER.size + index * SECTION.size)
+            sections[name] = view[offset:offset + length]
+
+        self.source = path
+        self.duplicates = MappingProxyType({})
+        self.ids = KeyTable(StringTable(sections["key_offsets"].cast("I"), sections["key_blob"]), sections["slots"].cast("I"))
+        self.strings = StringTable(sections["string_offsets"].cast("I"), sections["string_blob"])
+        self.offsets = sections["offsets"].cast("I")
+        self.candidate = sections["candidate"].cast("I")
+        self.pos = sections["pos"].cast("B")
+        self.frequency = sections["frequency"].cast("f")
+        self.best = sections["best"].cast("i")
+        self.cues = MappingProxyType({
+            cue: {int(entry): string for entry, string in cued.items()}
+            for cue, cued in json.loads(str(sections["cues"], "utf-8")).items()
+        })
+        # Stored at build time, so a compiled lexicon keys cached results the same as its source file
+        self.digest = digest.hex()
+        # The multi-word keys are stored separately so the phrase trie doesn't need a pass over every key
+        self._phrase_keys = json.loads(str(sections["phrases"], "utf-8"))
+        if len(self.offsets) != entries + 1 or len(self.candidate) != candidates or len(self.strings) != strings:
+            raise ValueError(f"{path} is truncated or corrupt; rebuild it with compiled_lexicon.py")
+
+    @cached_property
+    def phrases(self) -> dict:
+        root = {}
+        for key, entry in self._phrase_keys.items():
+            node = root
+            for word in key.split():
+                node = node.setdefault(word, {})
+            node[None] = entry
+        return root
+
+# Pack strings into (offsets, blob) sections
+def _string_sections(strings) -> tuple:
+    offsets = array.array("I", [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets.tobytes(), bytes(blob)
+
+# Write a loaded lexicon to `path` in the compiled format (atomically, so running workers never see a
+# half-written file)
+def write_compiled(lexicon: Lexicon, path: str) -> None:
+    keys = list(lexicon.ids)
+    key_offsets, key_blob = _string_sections(keys)
+    string_offsets, string_blob = _string_sections(lexicon.strings[index] for index in range(len(lexicon.strings)))
+
+    # Hash table at most half full, so probe chains stay short
+    size = 1
+    while size < 2 * len(keys):
+        size *= 2
+    slots = array.array("I", [0]) * size
+    for entry, key in enumerate(keys):
+        position = zlib.crc32(key.encode("utf-8")) & (size - 1)
+        while slots[position]:
+            position = (position + 1) & (size - 1)
+        slots[position] = entry + 1
+
+    sections = {
+        "key_offsets": key_offsets,
+        "key_blob": key_blob,
+        "slots": slots.tobytes(),
+        "offsets": bytes(lexicon.offsets),
+        "candidate": bytes(lexicon.candidate),
+        "pos": bytes(lexicon.pos),
+        "frequency": bytes(lexicon.frequency),
+        "best": bytes(lexicon.best),
+        "string_offsets": string_offsets,
+        "string_blob": string_blob,
+        "phrases": json.dumps({key: entry for entry, key in enumerate(keys) if " " in key}).encode("utf-8"),
+        "cues": json.dumps({cue: dict(cued) for cue, cued in lexicon.cues.items()}).encode("utf-8"),
+    }
+
+    header = HEADER.pack(
+        MAGIC, VERSION, sys.byteorder == "big", len(POS_TAGS),
+        len(keys), len(lexicon.candidate), len(lexicon.strings), bytes.fromhex(lexicon.digest),
+    )
+    offset = HEADER.size + len(SECTIONS) * SECTION.size
+    table = []
+    body = bytearray()
+    for name in SECTIONS:
+        padding = -(offset + len(body)) % 8
+        body += b"\0" * padding
+        table.append(SECTION.pack(offset + len(body), len(sections[name])))
+        body += sections[name]
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(table))
+        f.write(body)
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    # Compile a lexicon file: python compiled_lexicon.py [synonyms.tsv] [synonyms.lex]
+    # then run the bot with LEXICON_PATH pointing at the .lex file
+    import time
+    from lexicon import DEFAULT_LEXICON_PATH, load_lexicon
+
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LEXICON_PATH
+    output = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + COMPILED_SUFFIX
+    lexicon = load_lexicon(source)
+    write_compiled(lexicon, output)
+
+    started = time.perf_counter()
+    compiled = CompiledLexicon(output)
+    elapsed = time.perf_counter() - started
+    if any(compiled.candidates(word) != lexicon.candidates(word) for word in lexicon.ids) or compiled.cues != lexicon.cues:
+        sys.exit(f"{output} doesn't read back the same as {source}")
+    print(f"{len(compiled)} entries ({os.path.getsize(output) / 1024:.0f} KB) written to {output}, opens in {elapsed * 1000:.2f} ms")
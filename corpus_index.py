@@ -0,0 +1,205 @@
+import os
+import json
+import zlib
+import uuid
+import logging
+import numpy as np
+
+from similarity import SHINGLE_SIZE
+from tokenizer import WORD_RE
+
+logger = logging.getLogger(__name__)
+
+# Paragraphs sharing at least this fraction of their shingles with the reference corpus count as overlapping
+OVERLAP_THRESHOLD = float(os.getenv("CORPUS_OVERLAP_THRESHOLD", "0.3"))
+
+# Multipliers that mix the three word hashes of a shingle into one 64-bit value
+_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))
+
+# Stable 64-bit hashes of a text's word 3-grams (the same shingles similarity.py compares), unique and sorted.
+# Word hashes are CRC32 so the values are the same in every process and on every run.
+def shingle_hashes(text: str) -> np.ndarray:
+    words = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in WORD_RE.findall(text.lower())), dtype=np.uint64
+    )
+    if len(words) < SHINGLE_SIZE:
+        return np.empty(0, dtype=np.uint64)
+    hashes = words[:-2] * _MIX[0] + words[1:-1] * _MIX[1] + words[2:]
+    return np.unique(hashes)
+
+# Inverted index from shingle hash to reference document, stored as a directory of segments.
+# Each segment is a pair of .npy files (sorted shingle hashes and the matching document IDs) that is
+# opened with mmap, so loading costs almost nothing and worker processes share the pages.
+# Adding documents writes a new segment; compact() merges them.
+class CorpusIndex:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        manifest = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+        else:
+            data = {"documents": [], "segments": [], "version": None}
+        self.documents = data["documents"]
+        self.segments = [
+            (
+                np.load(os.path.join(path, f"{name}.hashes.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, f"{name}.docs.npy"), mmap_mode="r"),
+            )
+            for name in data["segments"]
+        ]
+        self.segment_names = list(data["segments"])
+        # A new random value each time the manifest is written (documents added, segments compacted, or the
+        # index rebuilt from scratch), so results that depend on the index can be keyed on it
+        self.version = data["version"]
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    # Add reference documents given as (name, text) pairs, as one new segment
+    def add(self, documents: list) -> None:
+        hashes = []
+        doc_ids = []
+        for name, text in documents:
+            document_hashes = shingle_hashes(text)
+            hashes.append(document_hashes)
+            doc_ids.append(np.full(len(document_hashes), len(self.documents), dtype=np.uint32))
+            self.documents.append(name)
+        if not hashes:
+            return
+        hashes = np.concatenate(hashes)
+        doc_ids = np.concatenate(doc_ids)
+        order = np.argsort(hashes, kind="stable")
+        self._write_segment(hashes[order], doc_ids[order])
+
+    # Merge every segment into one, so queries search a single array again
+    def compact(self) -> None:
+        if len(self.segments) < 2:
+            return
+        hashes = np.concatenate([segment_hashes for segment_hashes, _ in self.segments])
+        doc_ids = np.concatenate([segment_docs for _, segment_docs in self.segments])
+        order = np.argsort(hashes, kind="stable")
+        old_names = self.segment_names
+        self.segments = []
+        self.segment_names = []
+        self._write_segment(hashes[order], doc_ids[order])
+        for name in old_names:
+            for suffix in (".hashes.npy", ".docs.npy"):
+                os.remove(os.path.join(self.path, name + suffix))
+
+    # Overlap of each paragraph with the corpus: (fraction of its shingles found, best matching document
+    # name or None) per paragraph. Paragraphs shorter than one shingle get (0.0, None).
+    def overlaps(self, paragraphs: list) -> list:
+        per_paragraph = [shingle_hashes(text) for text in paragraphs]
+        counts = np.array([len(hashes) for hashes in per_paragraph], dtype=np.int64)
+        if not self.segments or not counts.sum():
+            return [(0.0, None)] * len(paragraphs)
+
+        queries = np.concatenate(per_paragraph)
+        owner = np.repeat(np.arange(len(paragraphs)), counts)
+        matched = np.full(len(queries), -1, dtype=np.int64)
+        for segment_hashes, segment_docs in self.segments:
+            positions = np.searchsorted(segment_hashes, queries)
+            inside = positions < len(segment_hashes)
+            hit = np.zeros(len(queries), dtype=bool)
+            hit[inside] = segment_hashes[positions[inside]] == queries[inside]
+            hit &= matched < 0
+            matched[hit] = segment_docs[positions[hit]]
+
+        hits = matched >= 0
+        found = np.bincount(owner[hits], minlength=len(paragraphs))
+
+        # The document sharing the most shingles with each paragraph: count (paragraph, document) pairs,
+        # then take the largest count per paragraph
+        pairs, pair_counts = np.unique(owner[hits] * len(self.documents) + matched[hits], return_counts=True)
+        order = np.lexsort((-pair_counts, pairs // len(self.documents)))
+        pair_owner = pairs[order] // len(self.documents)
+        first = np.flatnonzero(np.diff(pair_owner, prepend=-1))
+        best = np.full(len(paragraphs), -1, dtype=np.int64)
+        best[pair_owner[first]] = pairs[order][first] % len(self.documents)
+
+        return [
+            (found[index] / total, self.documents[best[index]]) if found[index] else (0.0, None)
+            for index, total in enumerate(counts.tolist())
+        ]
+
+    def _write_segment(self, hashes: np.ndarray, doc_ids: np.ndarray) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        # Number past every segment file on disk, including ones a compaction is about to remove
+        numbers = [int(entry.split("_")[1].split(".")[0]) for entry in os.listdir(self.path) if entry.startswith("segment_")]
+        name = f"segment_{max(numbers + [0]) + 1:06d}"
+        for suffix, array in ((".hashes.npy", hashes), (".docs.npy", doc_ids)):
+            tmp_path = os.path.join(self.path, f"{name}{suffix}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(self.path, name + suffix))
+        self.segment_names.append(name)
+        self.segments.append(
+            (
+                np.load(os.path.join(self.path, f"{name}.hashes.npy"), mmap_mode="r"),
+                np.load(os.path.join(self.path, f"{name}.docs.npy"), mmap_mode="r"),
+            )
+        )
+
+        # The manifest is replaced last, so readers only ever see complete segments
+        self.version = uuid.uuid4().hex
+        tmp_path = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"documents": self.documents, "segments": self.segment_names, "version": self.version}, f)
+        os.replace(tmp_path, os.path.join(self.path, "manifest.json"))
+
+# (manifest modification time, index) for the index at CORPUS_INDEX_DIR
+_index = None
+
+# The reference corpus index at CORPUS_INDEX_DIR, or None when unset. Reopened when documents have
+# been added since it was last loaded.
+def get_index() -> CorpusIndex:
+    global _index
+    path = os.getenv("CORPUS_INDEX_DIR")
+    if not path:
+        return None
+    try:
+        mtime = os.stat(os.path.join(path, "manifest.json")).st_mtime
+    except FileNotFoundError:
+        return None
+    if _index is None or _index[0] != mtime:
+        _index = (mtime, CorpusIndex(path))
+        logger.info("Loaded reference corpus index with %d documents from %s", len(_index[1]), path)
+    return _index[1]
+
+# Paragraph texts of a reference file (.docx, or plain text split on blank lines)
+def read_paragraphs(path: str) -> list:
+    if path.endswith(".docx"):
+        from traversal import open_document, iter_text_nodes
+        from fingerprints import group_paragraphs
+
+        nodes = list(iter_text_nodes(open_document(path)))
+        return ["".join(nodes[i].text or "" for i in indices) for indices in group_paragraphs(nodes)]
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [paragraph for paragraph in f.read().split("\n\n") if paragraph.strip()]
+
+if __name__ == "__main__":
+    # Build and query the reference corpus index:
+    #   python corpus_index.py INDEX_DIR add source1.docx notes.txt ...
+    #   python corpus_index.py INDEX_DIR query essay.docx
+    #   python corpus_index.py INDEX_DIR compact
+    import sys
+    import time
+
+    index = CorpusIndex(sys.argv[1])
+    command = sys.argv[2]
+    if command == "add":
+        index.add([(os.path.basename(path), "\n\n".join(read_paragraphs(path))) for path in sys.argv[3:]])
+        print(f"{len(index)} documents in {len(index.segments)} segments")
+    elif command == "compact":
+        index.compact()
+        print(f"{len(index)} documents in {len(index.segments)} segments")
+    elif command == "query":
+        paragraphs = read_paragraphs(sys.argv[3])
+        started = time.perf_counter()
+        results = index.overlaps(paragraphs)
+        elapsed = time.perf_counter() - started
+        for number, (fraction, source) in enumerate(results, 1):
+            if fraction >= OVERLAP_THRESHOLD:
+                print(f"paragraph {number}: {fraction:.0%} overlap with {source}")
+        print(f"{len(paragraphs)} paragraphs checked in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,54 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from rewriter import warm_up
+
+# Raised when a job is submitted while the queue is already full
+class QueueFullError(Exception):
+    pass
+
+# Warm up each worker process so the first job doesn't pay for loading the lexicon and libraries
+def _init_worker() -> None:
+    warm_up()
+
+# Runs blocking document jobs off the event loop in a bounded thread or process pool
+class JobExecutor:
+    def __init__(self, kind: str = "process", max_workers: int = None, max_queue: int = 0) -> None:
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Jobs allowed to wait for a free worker; anything beyond this is rejected
+        self.max_queue = max_queue
+        self.pending = 0
+
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        elif kind == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rewrite")
+        else:
+            raise ValueError(f"Unknown executor kind {kind!r}; expected 'process' or 'thread'")
+
+    # Build an executor from REWRITE_EXECUTOR, REWRITE_WORKERS and REWRITE_QUEUE_SIZE
+    @classmethod
+    def from_env(cls) -> "JobExecutor":
+        workers = os.getenv("REWRITE_WORKERS")
+        return cls(
+            kind=os.getenv("REWRITE_EXECUTOR", "process"),
+            max_workers=int(workers) if workers else None,
+            max_queue=int(os.getenv("REWRITE_QUEUE_SIZE", "16")),
+        )
+
+    # Run fn(*args) in the pool and wait for the result without blocking the event loop
+    async def run(self, fn, *args):
+        if self.pending >= self.max_workers + self.max_queue:
+            raise QueueFullError(f"{self.pending} jobs already in progress")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+
+from aiohttp import web, ClientSession
+
+# A stand-in for the Telegram Bot API, enough for the bot to start, receive documents and reply. Point the
+# bot at it with TELEGRAM_API_URL; every call is recorded in `calls` as (method, parameters).
+class FakeTelegram:
+    def __init__(self):
+        self.calls = []
+        self.files = {}
+        self.message_ids = itertools.count(1)
+        self.bot = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        return app
+
+    # Make a document available to getFile and return its file ID
+    def add_file(self, name: str, data: bytes) -> str:
+        file_id = f"file{len(self.files) + 1}"
+        self.files[file_id] = (name, data)
+        return file_id
+
+    def called(self, method: str) -> list:
+        return [parameters for name, parameters in self.calls if name == method]
+
+    def _message(self, parameters: dict, **fields) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(parameters["chat_id"]), "type": "private"},
+            "from": self.bot,
+            **fields,
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        parameters = {}
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                parameters = await request.json()
+            else:
+                for name, value in (await request.post()).items():
+                    # Uploads are kept as (file name, size)
+                    parameters[name] = (value.filename, len(value.file.read())) if isinstance(value, web.FileField) else value
+        self.calls.append((method, parameters))
+
+        if method == "getMe":
+            result = self.bot
+        elif method in ("setWebhook", "deleteWebhook", "setMyCommands", "sendChatAction"):
+            result = True
+        elif method == "getFile":
+            name, data = self.files[parameters["file_id"]]
+            result = {
+                "file_id": parameters["file_id"],
+                "file_unique_id": parameters["file_id"],
+                "file_size": len(data),
+                "file_path": f"documents/{parameters['file_id']}/{name}",
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(parameters, text=parameters.get("text", ""))
+        elif method == "sendDocument":
+            name, size = parameters["document"]
+            result = self._message(parameters, document={"file_id": "sent", "file_unique_id": "sent", "file_name": name, "file_size": size})
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": f"Not Found: method {method} isn't faked"}, status=404)
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].split("/")[1]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id][1])
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def message_update(update_id: int, user_id: int, **fields) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "from": user, **fields},
+    }
+
+async def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.1)
+    return condition()
+
+# Start the fake API and the bot in webhook mode against it, send it a few updates and check what comes
+# back. Returns the failed checks.
+async def check_webhook(timeout: float) -> list:
+    telegram = FakeTelegram()
+    runner = web.AppRunner(telegram.app())
+    await runner.setup()
+    api_port, webhook_port = free_port(), free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    secret = "fake-secret"
+    webhook = f"http://127.0.0.1:{webhook_port}"
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123456:fake",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        BOT_MODE="webhook",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_URL=webhook,
+        WEBHOOK_SECRET=secret,
+        REWRITE_EXECUTOR="thread",
+    )
+    bot = subprocess.Popen([sys.executable, "plagiarism_bot.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    failures = []
+
+    def check(ok: bool, description: str) -> None:
+        print(f"{'ok  ' if ok else 'FAIL'} {description}")
+        if not ok:
+            failures.append(description)
+
+    try:
+        async with ClientSession() as session:
+            async def post(data, token: str = secret) -> int:
+                headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": token}
+                async with session.post(f"{webhook}/telegram", data=json.dumps(data), headers=headers) as response:
+                    return response.status
+
+            async def healthy() -> bool:
+                try:
+                    async with session.get(f"{webhook}/healthz") as response:
+                        return response.status == 200
+                except OSError:
+                    return False
+
+            deadline = time.monotonic() + timeout
+            while not await healthy():
+                if bot.poll() is not None or time.monotonic() > deadline:
+                    check(False, "bot starts and serves /healthz")
+                    return failures
+                await asyncio.sleep(0.2)
+            check(True, "bot starts and serves /healthz")
+
+            registered = telegram.called("setWebhook")
+            check(
+                len(registered) == 1 and registered[0].get("url") == f"{webhook}/telegram" and registered[0].get("secret_token") == secret,
+                "setWebhook registers the URL and secret",
+            )
+
+            start = message_update(1, 42, text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+            check(await post(start, token="wrong") == 403, "wrong secret is refused with 403")
+            check(await post({}) == 400, "{} is refused with 400")
+            check(await post([]) == 400, "[] is refused with 400")
+            check(await post("update") == 400, "a JSON string is refused with 400")
+
+            check(await post(start) == 200, "/start update is accepted")
+            check(
+                await wait_for(lambda: any(str(m.get("chat_id")) == "42" for m in telegram.called("sendMessage")), timeout),
+                "/start is answered with sendMessage",
+            )
+
+            text = "\n\n".join(["The quick brown fox jumps over the lazy dog near the river bank."] * 5).encode()
+            file_id = telegram.add_file("essay.txt", text)
+            document = {"file_id": file_id, "file_unique_id": file_id, "file_name": "essay.txt", "mime_type": "text/plain", "file_size": len(text)}
+            check(await post(message_update(2, 43, document=document)) == 200, "document update is accepted")
+            check(
+                await wait_for(lambda: any(d["document"][0] == "processed_essay.txt" for d in telegram.called("sendDocument")), timeout),
+                "document is downloaded, processed and sent back",
+            )
+    finally:
+        # Ctrl+C, so the shutdown hooks run as they would for an operator
+        bot.send_signal(signal.SIGINT)
+        try:
+            await asyncio.to_thread(bot.wait, timeout)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+            bot.wait()
+        await runner.cleanup()
+
+    check(bot.returncode == 0, "bot shuts down cleanly on Ctrl+C")
+    return failures
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for running the bot without Telegram.")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="only run the fake API on this port (point TELEGRAM_API_URL at it)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each step of the webhook check")
+    args = parser.parse_args()
+
+    if args.serve:
+        web.run_app(FakeTelegram().app(), host="127.0.0.1", port=args.serve)
+        return
+
+    # Without --serve: check webhook mode end to end
+    failures = asyncio.run(check_webhook(args.timeout))
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from lxml import etree
+
+W_P = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+W_PPR = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}pPr"
+W_RPR = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr"
+
+# Group text nodes by the paragraph they belong to; returns the node indices of each paragraph
+# in document order
+def group_paragraphs(nodes: list) -> list:
+    groups = OrderedDict()
+    for index, node in enumerate(nodes):
+        groups.setdefault(next(node.iterancestors(W_P), None), []).append(index)
+    return list(groups.values())
+
+# Fingerprint of one paragraph's text nodes. It covers the text and the paragraph and run formatting,
+# so a paragraph only matches an earlier one if rewriting it would have started from the same input.
+def paragraph_fingerprint(nodes: list, indices: list) -> str:
+    h = hashlib.sha256()
+    paragraph = next(nodes[indices[0]].iterancestors(W_P), None)
+    properties = paragraph.find(W_PPR) if paragraph is not None else None
+    if properties is not None:
+        h.update(etree.tostring(properties))
+    for index in indices:
+        run_properties = nodes[index].getparent().find(W_RPR)
+        if run_properties is not None:
+            h.update(etree.tostring(run_properties))
+        h.update((nodes[index].text or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+# Fingerprint of a paragraph from formats without run formatting (plain text, Markdown, ODT, PDF)
+def text_fingerprint(texts: list) -> str:
+    return hashlib.sha256("\0".join(texts).encode("utf-8", "surrogateescape")).hexdigest()
+
+# Per-user store of rewritten paragraphs (fingerprint -> rewritten texts), so a new version of a
+# document only has its new or edited paragraphs rewritten. Entries expire after `retention`
+# seconds; each user keeps at most `max_paragraphs`, and only the `max_users` most recent users are kept.
+class ParagraphStore:
+    def __init__(self, max_paragraphs: int, max_users: int, retention: float) -> None:
+        self.max_paragraphs = max_paragraphs
+        self.max_users = max_users
+        self.retention = retention
+        # user -> OrderedDict(fingerprint -> (texts, last used)), least recently used first
+        self.users = OrderedDict()
+
+    # Build a store from PARAGRAPH_STORE_MAX, PARAGRAPH_STORE_USERS and PARAGRAPH_RETENTION_HOURS
+    @classmethod
+    def from_env(cls) -> "ParagraphStore":
+        return cls(
+            max_paragraphs=int(os.getenv("PARAGRAPH_STORE_MAX", "5000")),
+            max_users=int(os.getenv("PARAGRAPH_STORE_USERS", "1000")),
+            retention=float(os.getenv("PARAGRAPH_RETENTION_HOURS", "24")) * 3600,
+        )
+
+    # The user's unexpired paragraphs as fingerprint -> rewritten texts
+    def get(self, user_id: int) -> dict:
+        paragraphs = self.users.get(user_id)
+        if not paragraphs:
+            return {}
+        self._expire(paragraphs)
+        if not paragraphs:
+            del self.users[user_id]
+            return {}
+        return {fingerprint: texts for fingerprint, (texts, _) in paragraphs.items()}
+
+    # Remember the paragraphs of a processed document, evicting the oldest ones over the limits
+    def update(self, user_id: int, rewritten: dict) -> None:
+        if self.retention <= 0 or self.max_paragraphs <= 0:
+            return
+        now = time.monotonic()
+        paragraphs = self.users.setdefault(user_id, OrderedDict())
+        self.users.move_to_end(user_id)
+        for fingerprint, texts in rewritten.items():
+            paragraphs[fingerprint] = (texts, now)
+            paragraphs.move_to_end(fingerprint)
+
+        self._expire(paragraphs)
+        while len(paragraphs) > self.max_paragraphs:
+            paragraphs.popitem(last=False)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "paragraphs": sum(len(paragraphs) for paragraphs in self.users.values()),
+        }
+
+    def _expire(self, paragraphs: OrderedDict) -> None:
+        cutoff = time.monotonic() - self.retention
+        # Oldest first, so stop at the first entry that is still fresh
+        while paragraphs:
+            fingerprint, (_, last_used) = next(iter(paragraphs.items()))
+            if last_used >= cutoff:
+                break
+            del paragraphs[fingerprint]
@@ -0,0 +1,371 @@
+import io
+import os
+import re
+import time
+import shutil
+import zipfile
+import itertools
+from contextlib import contextmanager
+from lxml import etree
+
+import rewriter
+from rewriter import job_seed, file_seed, rewrite_runs
+from xml_rewriter import copy_info
+
+# Paragraphs rewritten together when streaming plain text and Markdown
+STREAM_BATCH = int(os.getenv("STREAM_BATCH_PARAGRAPHS", "256"))
+# Lines after which a paragraph without blank lines is cut, so one block never holds a whole file
+MAX_BLOCK_LINES = 200
+# Paragraphs of one document kept for incremental re-processing (the per-user store keeps no more anyway)
+MAX_TRACKED_PARAGRAPHS = int(os.getenv("PARAGRAPH_STORE_MAX", "5000"))
+
+# One job's rewrite state, shared by the format adapters. Each call to rewrite() runs a batch of
+# paragraphs through the shared engine (rewriter.rewrite_runs) and folds the batch's statistics into
+# the job's, so streaming formats can rewrite a file in many batches.
+class RewriteJob:
+    def __init__(self, stats: dict, workers: int = None, previous: dict = None, target: float = None) -> None:
+        self.stats = stats
+        self.seed = stats["seed"]
+        self.workers = workers
+        self.previous = previous
+        self.target = target
+        self.batches = 0
+        self.paragraphs = 0
+        self.weight = 0
+
+    # Rewrite run texts grouped into paragraphs (lists of run indices); returns the new texts in order
+    def rewrite(self, texts: list, paragraphs: list) -> list:
+        batch = {}
+        seed = self.seed if not self.batches else f"{self.seed}:b{self.batches}"
+        started = time.perf_counter()
+        rewritten = rewrite_runs(
+            texts, paragraphs, seed=seed, workers=self.workers, stats=batch, previous=self.previous, target=self.target,
+            reorder_spent=self.stats.get("reorder_seconds", 0),
+        )
+        batch["rewrite_seconds"] = time.perf_counter() - started
+        self._merge(batch, sum(len(text) for text in texts), len(paragraphs))
+        self.batches += 1
+        return rewritten
+
+    def _merge(self, batch: dict, weight: int, paragraphs: int) -> None:
+        stats = self.stats
+        for name in ("words", "words_replaced", "paragraphs_reused", "check_seconds", "rewrite_seconds", "score_seconds"):
+            if name in batch:
+                stats[name] = stats.get(name, 0) + batch[name]
+        # Reorder counts and timings (reorder_seconds, reorder_<strategy>_sentences, ...)
+        for name, value in batch.items():
+            if name.startswith("reorder_"):
+                stats[name] = stats.get(name, 0) + value
+        stats["passes"] = max(stats.get("passes", 0), batch["passes"])
+
+        # Document similarity as an average over the batches, weighted by their length
+        if weight:
+            stats["similarity"] = (stats.get("similarity", 0) * self.weight + batch["similarity"] * weight) / (self.weight + weight)
+            self.weight += weight
+
+        if "overlaps" in batch:
+            stats.setdefault("overlaps", []).extend(
+                (number + self.paragraphs, fraction, source) for number, fraction, source in batch["overlaps"]
+            )
+        if "paragraphs" in batch:
+            tracked = stats.setdefault("paragraphs", {})
+            for fingerprint, texts in itertools.islice(batch["paragraphs"].items(), max(0, MAX_TRACKED_PARAGRAPHS - len(tracked))):
+                tracked[fingerprint] = texts
+        self.paragraphs += paragraphs
+
+# A document format. process() reads the source's text runs, rewrites them with job.rewrite() and
+# writes the result to output (source and output can be paths or binary streams).
+class FormatAdapter:
+    extensions = ()
+    # Extension of the processed file (None: same as the input)
+    output_extension = None
+
+    def process(self, source, output, job: RewriteJob) -> None:
+        raise NotImplementedError
+
+# .docx goes through the existing engines (lxml or python-docx, see rewriter.ENGINE)
+class DocxAdapter(FormatAdapter):
+    extensions = (".docx",)
+
+    def process(self, source, output, job: RewriteJob) -> None:
+        rewriter.process_document(
+            source, output, seed=job.seed, workers=job.workers, stats=job.stats, previous=job.previous, target=job.target
+        )
+
+# Open a path or binary stream as text that round-trips exactly: undecodable bytes and line endings
+# are written back unchanged
+@contextmanager
+def open_text(target, mode: str):
+    if isinstance(target, str):
+        with open(target, mode, encoding="utf-8", errors="surrogateescape", newline="") as f:
+            yield f
+    else:
+        f = io.TextIOWrapper(target, encoding="utf-8", errors="surrogateescape", newline="")
+        try:
+            yield f
+            f.flush()
+        finally:
+            # Leave the caller's stream open
+            f.detach()
+
+# Plain text, streamed: blocks of lines separated by blank lines are paragraphs, rewritten a batch
+# at a time, so memory stays bounded however large the file is
+class TextAdapter(FormatAdapter):
+    extensions = (".txt",)
+
+    # Blocks of the file as lists of (text, rewritable) pieces; joined, they give the file back exactly
+    def blocks(self, lines):
+        block = []
+        for line in lines:
+            if not line.strip():
+                if block:
+                    yield [("".join(block), True)]
+                    block = []
+                yield [(line, False)]
+                continue
+            block.append(line)
+            if len(block) >= MAX_BLOCK_LINES:
+                yield [("".join(block), True)]
+                block = []
+        if block:
+            yield [("".join(block), True)]
+
+    def process(self, source, output, job: RewriteJob) -> None:
+        with open_text(source, "r") as src, open_text(output, "w") as dst:
+            blocks = self.blocks(src)
+            while True:
+                batch = list(itertools.islice(blocks, STREAM_BATCH))
+                if not batch:
+                    break
+
+                # Collect the rewritable pieces, one paragraph per block that has any
+                texts = []
+                paragraphs = []
+                for pieces in batch:
+                    indices = []
+                    for text, rewritable in pieces:
+                        if rewritable:
+                            indices.append(len(texts))
+                            texts.append(text)
+                    if indices:
+                        paragraphs.append(indices)
+
+                rewritten = iter(job.rewrite(texts, paragraphs))
+                for pieces in batch:
+                    dst.write("".join(next(rewritten) if rewritable else text for text, rewritable in pieces))
+
+# Markdown, streamed like plain text. Code blocks, front matter, inline code, link targets, URLs,
+# HTML tags and block markers ("#", "-", "1.", ">") are kept exactly; only the prose is rewritten.
+class MarkdownAdapter(TextAdapter):
+    extensions = (".md", ".markdown")
+
+    FENCE_RE = re.compile(r"^\s{0,3}(```|~~~)")
+    PROTECTED_RE = re.compile(
+        r"`+[^`]*`+"                                     # inline code
+        r"|\]\([^)]*\)|\]\[[^\]]*\]"                     # link and image targets
+        r"|^\s{0,3}\[[^\]]+\]:.*$"                       # reference definitions
+        r"|<[^>\n]+>"                                    # HTML tags and autolinks
+        r"|https?://\S+"                                 # bare URLs
+        r"|^\s*(?:#{1,6}|[-*+]|\d+[.)]|>)(?:\s+(?:[-*+]|\d+[.)]|>))*\s+"  # block markers
+        r"|^\s*(?:[-*_]\s*){3,}$",                       # horizontal rules
+        re.MULTILINE,
+    )
+
+    # Split a line into (text, rewritable) pieces around the protected spans
+    def split_line(self, line: str) -> list:
+        pieces = []
+        position = 0
+        for match in self.PROTECTED_RE.finditer(line):
+            if match.start() > position:
+                pieces.append((line[position:match.start()], True))
+            pieces.append((match.group(), False))
+            position = match.end()
+        if position < len(line):
+            pieces.append((line[position:], True))
+        return pieces
+
+    def blocks(self, lines):
+        block = []
+        fence = None
+        for number, line in enumerate(lines):
+            if fence is not None:
+                # Inside front matter or a fenced code block, until its closing line
+                if line.strip().startswith(fence):
+                    fence = None
+            elif number == 0 and line.strip() == "---":
+                fence = "---"
+            elif self.FENCE_RE.match(line):
+                fence = self.FENCE_RE.match(line).group(1)
+            elif line.strip() and not (line.startswith(("    ", "\t")) and not block):
+                block.extend(self.split_line(line))
+                if len(block) >= MAX_BLOCK_LINES:
+                    yield block
+                    block = []
+                continue
+
+            # Blank lines, code and front matter end the current paragraph and are kept as they are
+            if block:
+                yield block
+                block = []
+            yield [(line, False)]
+        if block:
+            yield block
+
+ODF_TEXT = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+# OpenDocument text (.odt): the text of every paragraph and heading in content.xml and styles.xml
+# (headers and footers) is rewritten in place with lxml; every other member is copied unchanged
+class OdtAdapter(FormatAdapter):
+    extensions = (".odt",)
+
+    PARAGRAPH_TAGS = {f"{{{ODF_TEXT}}}p", f"{{{ODF_TEXT}}}h"}
+    # Generated content whose own text isn't prose
+    SKIP_TAGS = {
+        f"{{{ODF_TEXT}}}{name}"
+        for name in ("note-citation", "page-number", "page-count", "date", "time", "sequence", "bookmark-ref", "reference-ref")
+    }
+    PARTS = ("content.xml", "styles.xml")
+
+    # Text slots (element, "text" or "tail") in document order, and their paragraphs as lists of slot indices
+    def collect(self, root) -> tuple:
+        slots = []
+        groups = {}
+
+        def visit(element, paragraph) -> None:
+            if element.tag in self.PARAGRAPH_TAGS:
+                paragraph = element
+            if paragraph is not None and element.text and element.tag not in self.SKIP_TAGS:
+                groups.setdefault(paragraph, []).append(len(slots))
+                slots.append((element, "text"))
+            for child in element:
+                visit(child, paragraph)
+                if paragraph is not None and child.tail:
+                    groups.setdefault(paragraph, []).append(len(slots))
+                    slots.append((child, "tail"))
+
+        visit(root, None)
+        return slots, list(groups.values())
+
+    def process(self, source, output, job: RewriteJob) -> None:
+        started = time.perf_counter()
+        with zipfile.ZipFile(source) as zin:
+            names = set(zin.namelist())
+            trees = {}
+            slots = []
+            paragraphs = []
+            for name in self.PARTS:
+                if name not in names:
+                    continue
+                root = etree.fromstring(zin.read(name), parser=etree.XMLParser(huge_tree=True))
+                trees[name] = root
+                part_slots, part_paragraphs = self.collect(root)
+                paragraphs.extend([index + len(slots) for index in indices] for indices in part_paragraphs)
+                slots.extend(part_slots)
+            job.stats["parse_seconds"] = time.perf_counter() - started
+
+            texts = [getattr(element, attribute) for element, attribute in slots]
+            for (element, attribute), text in zip(slots, job.rewrite(texts, paragraphs)):
+                setattr(element, attribute, text)
+
+            started = time.perf_counter()
+            with zipfile.ZipFile(output, "w") as zout:
+                for info in zin.infolist():
+                    out_info = copy_info(info)
+                    if info.filename in trees:
+                        zout.writestr(out_info, etree.tostring(trees.pop(info.filename), xml_declaration=True, encoding="UTF-8"))
+                    else:
+                        with zin.open(info) as src, zout.open(out_info, "w") as dst:
+                            shutil.copyfileobj(src, dst, 1024 * 1024)
+            job.stats["save_seconds"] = time.perf_counter() - started
+
+# PDF: text is extracted page by page (with pypdf) and the rewritten text is returned as a .docx,
+# one paragraph per paragraph of the PDF and a page break between pages. Layout isn't kept.
+class PdfAdapter(FormatAdapter):
+    extensions = (".pdf",)
+    output_extension = ".docx"
+
+    # Lines ending a paragraph: sentence punctuation at the end of a line that stops short of the margin
+    END_RE = re.compile(r"[.!?:\"')\]]\s*$")
+
+    # Join extracted lines back into paragraphs, undoing hyphenation at line ends
+    def page_paragraphs(self, text: str) -> list:
+        lines = [line.strip() for line in text.splitlines()]
+        width = max((len(line) for line in lines), default=0)
+        paragraphs = []
+        current = ""
+        for line in lines:
+            if not line:
+                if current:
+                    paragraphs.append(current)
+                current = ""
+                continue
+            if current.endswith("-") and line[:1].islower():
+                current = current[:-1] + line
+            else:
+                current = f"{current} {line}" if current else line
+            if self.END_RE.search(line) and len(line) < width * 0.8:
+                paragraphs.append(current)
+                current = ""
+        if current:
+            paragraphs.append(current)
+        return paragraphs
+
+    def process(self, source, output, job: RewriteJob) -> None:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError("PDF support needs the pypdf package.")
+        from docx import Document
+        from docx.enum.text import WD_BREAK
+
+        reader = PdfReader(source)
+        doc = Document()
+        job.stats["parse_seconds"] = 0.0
+        for number, page in enumerate(reader.pages):
+            page_started = time.perf_counter()
+            texts = self.page_paragraphs(page.extract_text() or "")
+            job.stats["parse_seconds"] += time.perf_counter() - page_started
+            if number:
+                doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+            for text in job.rewrite(texts, [[index] for index in range(len(texts))]):
+                doc.add_paragraph(text)
+
+        started = time.perf_counter()
+        doc.save(output)
+        job.stats["save_seconds"] = time.perf_counter() - started
+
+# Adapters by file extension
+ADAPTERS = {}
+for _adapter in (DocxAdapter(), TextAdapter(), MarkdownAdapter(), OdtAdapter(), PdfAdapter()):
+    for _extension in _adapter.extensions:
+        ADAPTERS[_extension] = _adapter
+
+# Supported extensions, for messages to the user
+SUPPORTED = ", ".join(sorted(ADAPTERS))
+
+# The adapter for a file name, or None if the format isn't supported
+def adapter_for(name: str) -> FormatAdapter:
+    return ADAPTERS.get(os.path.splitext(name)[1].lower())
+
+# Name of the processed file sent back to the user
+def output_name(name: str) -> str:
+    stem, extension = os.path.splitext(name)
+    return f"processed_{stem}{adapter_for(name).output_extension or extension}"
+
+# Process a document of any supported format held in memory; returns the processed file's bytes and
+# the job's statistics (including the seed used)
+def process_bytes(
+    data: bytes, name: str, seed: int = None, workers: int = None, previous: dict = None, target: float = None
+) -> tuple:
+    output = io.BytesIO()
+    stats = {"seed": job_seed(data) if seed is None else seed}
+    adapter_for(name).process(io.BytesIO(data), output, RewriteJob(stats, workers, previous, target))
+    return output.getvalue(), stats
+
+# Process a document of any supported format on disk; returns the job's statistics
+def process_file(
+    source: str, output: str, name: str, seed: int = None, workers: int = None, previous: dict = None, target: float = None
+) -> dict:
+    stats = {"seed": file_seed(source) if seed is None else seed}
+    adapter_for(name).process(source, output, RewriteJob(stats, workers, previous, target))
+    return stats
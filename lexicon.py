@@ -0,0 +1,268 @@
+import os
+import array
+import hashlib
+import logging
+import threading
+from functools import cached_property
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Default location of the synonym data file (can be overridden with LEXICON_PATH)
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synonyms.tsv")
+
+# Parts of speech a candidate can be tagged with. Untagged candidates (ANY) fit every context;
+# ANY is also the hint when the neighbouring words say nothing about a word. Without a hint, only
+# untagged candidates and those with the entry's main part of speech (its first candidate's) are used,
+# so a noun with no context never gets its verb synonym ("case study" -> "case examine").
+POS_TAGS = ("ANY", "NOUN", "VERB", "ADJ", "ADV")
+ANY, NOUN, VERB, ADJ, ADV = range(len(POS_TAGS))
+
+# Frequency score (Zipf scale: log10 of occurrences per billion words) of candidates that don't give one
+DEFAULT_FREQUENCY = 4.0
+# Changed whenever the choice of candidates changes for the same lexicon file; part of the digest, so
+# results cached with the old choices aren't reused
+SELECTION_VERSION = 2
+# Score taken off candidates that are lexicon keys themselves, so that rewriting a rewrite doesn't drift
+# further and further from the original ("knowledge" -> "understanding" -> "comprehension")
+CHAIN_PENALTY = 1.0
+
+# Part of speech a word most likely has after these words ("the water", "to water", "very clear")
+AFTER_WORD = {
+    **dict.fromkeys(
+        ("the", "a", "an", "this", "these", "those", "my", "your", "his", "her", "its", "our", "their",
+         "some", "any", "each", "every", "no", "many", "much", "few", "several", "such"),
+        NOUN,
+    ),
+    **dict.fromkeys(
+        ("to", "will", "would", "can", "could", "should", "must", "may", "might", "shall", "cannot",
+         "i", "we", "they", "you", "don't", "doesn't", "didn't", "won't", "can't"),
+        VERB,
+    ),
+    **dict.fromkeys(("very", "too", "quite", "rather", "extremely", "really", "so"), ADJ),
+}
+# ... and before these words ("water the plants", "analysis of the data", "research is")
+BEFORE_WORD = {
+    **dict.fromkeys(
+        ("the", "a", "an", "this", "these", "those", "my", "your", "his", "her", "its", "our", "their"),
+        VERB,
+    ),
+    **dict.fromkeys(("of", "is", "are", "was", "were", "has", "have"), NOUN),
+}
+
+# Read-only synonym lexicon, built once and shared by every rewrite. Every key has one or more
+# candidates, tagged with a part of speech and scored by frequency. The candidates live in flat
+# arrays, and the best candidate for each (key, part of speech) is picked once here, so choosing a
+# replacement is a couple of dict lookups and one array index whatever the size of the lexicon.
+class Lexicon:
+    def __init__(self, entries: dict, duplicates: dict = None, source: str = None) -> None:
+        # Key -> entry number; MappingProxyType keeps the table immutable without copying it
+        self.ids = MappingProxyType({key: entry for entry, key in enumerate(entries)})
+        # Keys that appeared more than once in the source: key -> every value seen, in order
+        self.duplicates = MappingProxyType({k: tuple(v) for k, v in (duplicates or {}).items()})
+        self.source = source
+
+        # Candidate replacement strings, each stored once
+        self.strings = []
+        string_ids = {}
+        # Candidates of entry e are offsets[e]:offsets[e + 1] in candidate (string ID), pos and frequency
+        self.offsets = array.array("I", [0])
+        self.candidate = array.array("I")
+        self.pos = array.array("B")
+        self.frequency = array.array("f")
+        # Best candidate string per (entry, context part of speech), -1 when none fits
+        self.best = array.array("i", [-1]) * (len(entries) * len(POS_TAGS))
+        # Cue word -> {entry: string ID}: a candidate picked whenever the cue is next to the word
+        cues = {}
+
+        for entry, candidates in enumerate(entries.values()):
+            best_scores = [None] * len(POS_TAGS)
+            main_pos = candidates[0][1]
+            for replacement, pos, frequency, cue_words in candidates:
+                string = string_ids.setdefault(replacement, len(self.strings))
+                if string == len(self.strings):
+                    self.strings.append(replacement)
+                self.candidate.append(string)
+                self.pos.append(pos)
+                self.frequency.append(frequency)
+                # Candidates with cue words are for one sense of the word only, and never picked without a cue
+                for cue in cue_words:
+                    cues.setdefault(cue, {}).setdefault(entry, string)
+                if cue_words:
+                    continue
+
+                score = frequency - (CHAIN_PENALTY if replacement.lower() in self.ids else 0)
+                # Earlier candidates win ties
+                for context in range(len(POS_TAGS)):
+                    if pos in (ANY, context if context != ANY else main_pos):
+                        if best_scores[context] is None or score > best_scores[context]:
+                            best_scores[context] = score
+                            self.best[entry * len(POS_TAGS) + context] = string
+            self.offsets.append(len(self.candidate))
+        self.cues = MappingProxyType(cues)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.ids
+
+    # Replacement for a word without context (its overall best candidate)
+    def get(self, word: str, default: str = None) -> str:
+        entry = self.ids.get(word)
+        return default if entry is None else self.choose(entry)
+
+    # Pick the replacement for an entry given the words either side of it (lower-case, None when there
+    # is no neighbour). A cue word next to it decides outright; otherwise the neighbours hint at the part
+    # of speech. Returns None when no candidate fits the context.
+    def choose(self, entry: int, previous: str = None, following: str = None) -> str:
+        string = self.choose_id(entry, previous, following)
+        return self.strings[string] if string >= 0 else None
+
+    # Same as choose, returning the index into strings (-1 when no candidate fits)
+    def choose_id(self, entry: int, previous: str = None, following: str = None) -> int:
+        for word in (previous, following):
+            cued = self.cues.get(word)
+            if cued is not None and entry in cued:
+                return cued[entry]
+        hint = AFTER_WORD.get(previous, ANY)
+        if hint == ANY:
+            hint = BEFORE_WORD.get(following, ANY)
+        return self.best[entry * len(POS_TAGS) + hint]
+
+    # A key's candidates as (replacement, part of speech, frequency) tuples
+    def candidates(self, word: str) -> list:
+        entry = self.ids[word]
+        return [
+            (self.strings[self.candidate[i]], POS_TAGS[self.pos[i]], round(self.frequency[i], 2))
+            for i in range(self.offsets[entry], self.offsets[entry + 1])
+        ]
+
+    # Content hash of the entries, so cached results can be tied to a lexicon version
+    @cached_property
+    def digest(self) -> str:
+        h = hashlib.sha256(f"selection {SELECTION_VERSION}\n".encode("utf-8"))
+        for word, entry in self.ids.items():
+            h.update(f"{word}\t{self.candidates(word)}\n".encode("utf-8"))
+        h.update(repr(sorted((cue, sorted(cued.items())) for cue, cued in self.cues.items())).encode("utf-8"))
+        return h.hexdigest()
+
+    # Trie of the multi-word keys ("hard work" -> {"hard": {"work": {None: entry}}});
+    # single words are looked up directly in ids
+    @cached_property
+    def phrases(self) -> dict:
+        root = {}
+        for key, entry in self.ids.items():
+            words = key.split()
+            if len(words) < 2:
+                continue
+            node = root
+            for word in words:
+                node = node.setdefault(word, {})
+            node[None] = entry
+        return root
+
+    # Duplicates whose values disagree (the earlier values were silently lost)
+    def conflicts(self) -> dict:
+        return {k: v for k, v in self.duplicates.items() if len(set(v)) > 1}
+
+    # Keys with candidates that are keys themselves: key -> those candidates
+    def chains(self) -> dict:
+        chains = {}
+        for word in self.ids:
+            linked = [replacement for replacement, _, _ in self.candidates(word) if replacement.lower() in self.ids]
+            if linked:
+                chains[word] = linked
+        return chains
+
+# Parse one candidate field: <replacement>[|<part of speech>[|<frequency>[|<cue>,<cue>...]]]
+def parse_candidate(field: str) -> tuple:
+    parts = [part.strip() for part in field.split("|")]
+    if len(parts) > 4 or not parts[0]:
+        raise ValueError(f"expected '<replacement>[|<pos>[|<frequency>[|<cues>]]]', got {field!r}")
+    pos = parts[1].upper() if len(parts) > 1 and parts[1] else "ANY"
+    if pos not in POS_TAGS:
+        raise ValueError(f"unknown part of speech {parts[1]!r} (expected one of {', '.join(POS_TAGS)})")
+    frequency = float(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_FREQUENCY
+    cues = tuple(cue.strip().lower() for cue in parts[3].split(",") if cue.strip()) if len(parts) > 3 else ()
+    return parts[0], POS_TAGS.index(pos), frequency, cues
+
+# Parse a tab-separated lexicon file (<word><TAB><candidate>[<TAB><candidate>...] per line)
+def load_lexicon(path: str, report: bool = True) -> Lexicon:
+    entries = {}
+    seen = {}
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) < 2:
+                raise ValueError(f"{path}:{line_no}: expected '<word><TAB><candidate>...', got {line!r}")
+            try:
+                candidates = [parse_candidate(field) for field in fields[1:]]
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_no}: {e}")
+            word = fields[0].strip().lower()
+            seen.setdefault(word, []).append("\t".join(field.strip() for field in fields[1:]))
+            # Later entries win, matching the behaviour of the old dict literal
+            entries[word] = candidates
+
+    duplicates = {k: v for k, v in seen.items() if len(v) > 1}
+    lexicon = Lexicon(entries, duplicates, source=path)
+    if report:
+        report_duplicates(lexicon)
+    return lexicon
+
+# Log keys that are defined more than once in the lexicon file, and candidates that chain into other keys
+def report_duplicates(lexicon: Lexicon) -> None:
+    conflicts = lexicon.conflicts()
+    if conflicts:
+        logger.warning(
+            "Lexicon %s: %d keys are defined more than once with different values, the last one wins: %s "
+            "(run `python lexicon.py` for details)",
+            lexicon.source, len(conflicts), ", ".join(sorted(conflicts)),
+        )
+    redundant = len(lexicon.duplicates) - len(conflicts)
+    if redundant:
+        logger.info("Lexicon %s: %d keys are repeated with the same value", lexicon.source, redundant)
+    chains = lexicon.chains()
+    if chains:
+        logger.info(
+            "Lexicon %s: %d keys have candidates that are keys themselves (scored down by %.1f)",
+            lexicon.source, len(chains), CHAIN_PENALTY,
+        )
+
+_lexicon = None
+# Loading happens in threads (pre-warm, the bot's cache-key settings), so only one of them loads the file
+_lexicon_lock = threading.Lock()
+
+# Return the shared lexicon, loading it on first use. A compiled lexicon (see compiled_lexicon.py) is
+# memory-mapped instead of parsed.
+def get_lexicon() -> Lexicon:
+    global _lexicon
+    if _lexicon is not None:
+        return _lexicon
+    with _lexicon_lock:
+        if _lexicon is not None:
+            return _lexicon
+        path = os.getenv("LEXICON_PATH", DEFAULT_LEXICON_PATH)
+        if path.endswith(".lex"):
+            from compiled_lexicon import CompiledLexicon
+
+            _lexicon = CompiledLexicon(path)
+            logger.info("Opened compiled lexicon %s with %d entries", path, len(_lexicon))
+        else:
+            _lexicon = load_lexicon(path)
+    return _lexicon
+
+if __name__ == "__main__":
+    # Print a duplicate and chain report: python lexicon.py [path]
+    import sys
+
+    lex = load_lexicon(sys.argv[1] if len(sys.argv) > 1 else os.getenv("LEXICON_PATH", DEFAULT_LEXICON_PATH), report=False)
+    print(f"{len(lex)} entries with {len(lex.candidate)} candidates loaded from {lex.source}")
+    for word, values in sorted(lex.conflicts().items()):
+        print(f"  {word}: {' -> '.join(values)}")
+    for word, linked in sorted(lex.chains().items()):
+        print(f"  chain: {word} -> {', '.join(linked)}")
@@ -0,0 +1,146 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Every metric defined below, in the order they're exported
+_registry = []
+
+# Base for a named metric with optional labels (values are kept per label combination)
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts, total = self.values.get(key, ([0] * len(self.BUCKETS), 0.0))
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = (counts, total + value)
+
+    # (number of observations, sum of observed values)
+    def summary(self, **labels) -> tuple:
+        counts, total = self.values.get(self._key(labels), ([0] * len(self.BUCKETS), 0.0))
+        return counts[-1], total
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total) in sorted(self.values.items()):
+            for bound, count in zip(self.BUCKETS, counts):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': le})} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {counts[-1]}")
+        return lines
+
+# Metrics for the document pipeline
+STAGE_SECONDS = Histogram("aibot_stage_seconds", "Time spent in each stage of handling a document.", ["stage"])
+STAGE_IN_FLIGHT = Gauge("aibot_stage_in_flight", "Documents currently in each stage.", ["stage"])
+JOBS_IN_FLIGHT = Gauge("aibot_jobs_in_flight", "Documents currently being handled.")
+DOCUMENTS = Counter("aibot_documents_total", "Documents handled, by outcome.", ["outcome"])
+BYTES = Counter("aibot_bytes_total", "Document bytes received (in) and sent back (out).", ["direction"])
+WORDS = Counter("aibot_words_total", "Words seen by the rewriter.")
+WORDS_REPLACED = Counter("aibot_words_replaced_total", "Words (or phrases) replaced with a synonym.")
+RUNS_MERGED = Counter("aibot_runs_merged_total", "Runs coalesced with an identically formatted neighbour before rewriting.")
+PARAGRAPHS_REUSED = Counter("aibot_paragraphs_reused_total", "Unchanged paragraphs copied from a user's earlier submission.")
+REORDER_SENTENCES = Counter("aibot_reorder_sentences_total", "Sentences each reorder strategy was tried on.", ["strategy"])
+REORDER_APPLIED = Counter("aibot_reorder_applied_total", "Sentences each reorder strategy restructured.", ["strategy"])
+REORDER_SECONDS = Counter("aibot_reorder_seconds_total", "Time spent in each reorder strategy.", ["strategy"])
+REORDER_SKIPPED = Counter("aibot_reorder_skipped_total", "Reorder strategies skipped to stay within the per-document budget.")
+
+# Time a stage of document handling and count it as in flight while it runs
+@contextmanager
+def track(stage: str):
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+# Record the statistics a worker returned for the stages it ran (parse, check, rewrite, score, save)
+def record_worker_stats(stats: dict) -> None:
+    for stage in ("parse", "check", "rewrite", "score", "save"):
+        if f"{stage}_seconds" in stats:
+            STAGE_SECONDS.observe(stats[f"{stage}_seconds"], stage=stage)
+    WORDS.inc(stats.get("words", 0))
+    WORDS_REPLACED.inc(stats.get("words_replaced", 0))
+    PARAGRAPHS_REUSED.inc(stats.get("paragraphs_reused", 0))
+    RUNS_MERGED.inc(stats.get("runs_merged", 0))
+    for name, value in stats.items():
+        if name.startswith("reorder_") and name.endswith("_sentences"):
+            strategy = name[len("reorder_"):-len("_sentences")]
+            REORDER_SENTENCES.inc(value, strategy=strategy)
+            REORDER_APPLIED.inc(stats.get(f"reorder_{strategy}_applied", 0), strategy=strategy)
+            REORDER_SECONDS.inc(stats.get(f"reorder_{strategy}_seconds", 0), strategy=strategy)
+    REORDER_SKIPPED.inc(stats.get("reorder_skipped", 0))
+
+# All metrics in the Prometheus text exposition format
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Serve /metrics on a local port; returns the runner so it can be cleaned up on shutdown.
+# aiohttp is imported here so the bot doesn't load it when metrics are disabled.
+async def start_metrics_server(host: str, port: int) -> "web.AppRunner":
+    from aiohttp import web
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
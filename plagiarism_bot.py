@@ -1,13 +1,25 @@
+import io
 import os
+import re
+import time
+import asyncio
+import logging
+import tempfile
 from dotenv import load_dotenv
 from telegram import Update, InputFile
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from docx import Document
-import nest_asyncio  # For environments where an event loop is already running
-import random  # For introducing randomness in text rewriting
-
-# Apply nest_asyncio to allow re-entrant event loops (for Jupyter/IDEs)
-nest_asyncio.apply()
+from rewriter import rewrite_settings, job_seed, warm_up
+from reorder import REORDER_BUDGET_MS
+from executor import JobExecutor, QueueFullError
+from scheduler import FairScheduler, AdmissionError
+from cache import ResultCache
+from fingerprints import ParagraphStore
+import formats
+import archive
+import metrics
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -19,997 +31,439 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("Please ensure TELEGRAM_BOT_TOKEN is set in the .env file.")
 
+# How updates are received: "polling" (default) or "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Number of updates handled at the same time
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '256'))
+
+# Alternative Bot API server (e.g. a local fake Telegram server for testing)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Files larger than this (in bytes) are spilled to temp files instead of processed in memory
+SPILL_THRESHOLD = int(os.getenv('SPILL_THRESHOLD', str(8 * 1024 * 1024)))
+
+# Local port for the Prometheus metrics endpoint (disabled when unset)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Load the lexicon and libraries in the background as soon as the bot starts, instead of on the first
+# document (startup itself never waits for them)
+PREWARM = os.getenv('PREWARM', '0') == '1'
+
+# Telegram user IDs allowed to use /stats (comma-separated; nobody when unset)
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()}
+
+# Seconds between progress messages while an archive is processed
+ARCHIVE_PROGRESS_INTERVAL = float(os.getenv('ZIP_PROGRESS_INTERVAL', '5'))
+
+# Job statistics kept with a cached result, so a cache hit gets the same reply as the first run
+CACHED_STATS = ("similarity", "overlaps", "passes")
+
+# A seed only reproduces a rewrite exactly when reordering isn't held to a time budget
+EXACT_REPLAY = REORDER_BUDGET_MS <= 0
+
+# Stages reported by /stats, in pipeline order
+STAGES = ("download", "parse", "check", "rewrite", "score", "save", "process", "upload", "total")
+
+# A caption like "seed 12345" replays an earlier rewrite exactly
+SEED_RE = re.compile(r"\bseed\s*[=:]?\s*(\d+)\b", re.IGNORECASE)
+# A caption like "target 40%" keeps rewriting until the text is at most 40% similar to the original
+TARGET_RE = re.compile(r"\btarget\s*[=:]?\s*(\d+(?:\.\d+)?)\s*%?", re.IGNORECASE)
+
 # Command: /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
-        "Welcome! Send me a .docx file, and I'll rewrite the text while keeping the formatting intact."
+        f"Welcome! Send me a document ({formats.SUPPORTED}), and I'll rewrite the text while keeping the formatting intact.\n"
+        "To rewrite many documents at once, send them together in a .zip file and you'll get one .zip back.\n"
+        + (
+            "Every rewrite comes with a seed; send the same file with the caption \"seed <number>\" to get that exact rewrite again.\n"
+            if EXACT_REPLAY
+            else "Every rewrite comes with a seed; send the same file with the caption \"seed <number>\" to get a similar rewrite again.\n"
+        )
+        + "Add \"target 40%\" to the caption to keep rewriting until the text is at most 40% similar to your original."
     )
 
-# Handle incoming .docx files
+# Command: /stats (admins only: the users in ADMIN_USER_IDS)
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    cache = context.bot_data["cache"].stats()
+    paragraphs = context.bot_data["paragraphs"].stats()
+    executor = context.bot_data["executor"]
+    scheduler = context.bot_data["scheduler"]
+    lines = [
+        f"Cache: {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate), "
+        f"{cache['entries']} entries, {cache['memory_bytes'] / 1024 / 1024:.1f} MB in memory, "
+        f"{cache['disk_bytes'] / 1024 / 1024:.1f} MB on disk",
+        f"Jobs: {scheduler.total_running} running, {scheduler.queued} waiting for their turn, "
+        f"{executor.pending} in the worker pool",
+        f"Documents: {metrics.DOCUMENTS.get(outcome='ok'):.0f} ok, {metrics.DOCUMENTS.get(outcome='error'):.0f} failed, "
+        f"{metrics.DOCUMENTS.get(outcome='rejected') + metrics.DOCUMENTS.get(outcome='busy'):.0f} rejected",
+        f"Bytes: {metrics.BYTES.get(direction='in') / 1024 / 1024:.1f} MB in, "
+        f"{metrics.BYTES.get(direction='out') / 1024 / 1024:.1f} MB out",
+        f"Words: {metrics.WORDS.get():.0f} seen, {metrics.WORDS_REPLACED.get():.0f} replaced, "
+        f"{metrics.RUNS_MERGED.get():.0f} runs merged before rewriting",
+        f"Paragraphs: {metrics.PARAGRAPHS_REUSED.get():.0f} reused, "
+        f"{paragraphs['paragraphs']} stored for {paragraphs['users']} users",
+    ]
+    for stage in STAGES:
+        count, total = metrics.STAGE_SECONDS.summary(stage=stage)
+        if count:
+            lines.append(f"{stage}: {count} runs, {total / count * 1000:.0f} ms average")
+    await update.message.reply_text("\n".join(lines))
+
+# Handle incoming documents
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Check if the file is a .docx
-    if not update.message.document.file_name.endswith('.docx'):
-        await update.message.reply_text("Please send a .docx file.")
+    document = update.message.document
+    is_archive = archive.is_archive(document.file_name or "")
+
+    # Check that the format is supported
+    if not is_archive and formats.adapter_for(document.file_name or "") is None:
+        await update.message.reply_text(f"Please send a document in one of these formats: {formats.SUPPORTED}, or several in a .zip file.")
         return
 
-    # Download the file
-    file = await update.message.document.get_file()
-    file_path = f"temp_{update.message.document.file_name}"
-    await file.download_to_drive(file_path)
+    executor = context.bot_data["executor"]
+    match = SEED_RE.search(update.message.caption or "")
+    seed = int(match.group(1)) if match else None
+    match = TARGET_RE.search(update.message.caption or "")
+    target = min(float(match.group(1)), 100) / 100 if match else None
+
+    # Paragraphs rewritten for this user before; an explicit seed means a full replay, so nothing is reused
+    paragraphs = context.bot_data["paragraphs"]
+    previous = {} if seed is not None else paragraphs.get(update.effective_user.id)
+    output_name = archive.output_name(document.file_name) if is_archive else formats.output_name(document.file_name)
 
-    # Process the file
-    processed_file_path = None
+    # Admission control: refuse oversized files and over-quota users before downloading anything
     try:
-        processed_file_path = process_docx(file_path)
-        
-        # Send the processed file back to the user
-        with open(processed_file_path, 'rb') as f:
-            await update.message.reply_document(document=InputFile(f))
-        
+        ticket = context.bot_data["scheduler"].submit(update.effective_user.id, document.file_size)
+    except AdmissionError as e:
+        metrics.DOCUMENTS.inc(outcome="rejected")
+        await update.message.reply_text(str(e))
+        return
+
+    metrics.JOBS_IN_FLIGHT.inc()
+    try:
+        if ticket.position:
+            await update.message.reply_text(f"Your file is number {ticket.position} in the queue. I'll start on it shortly.")
+
+        # Wait for this user's turn, then download and process
+        async with ticket:
+            with metrics.track("total"):
+                file = await document.get_file()
+
+                if is_archive:
+                    # Every document of the archive, rewritten into one archive sent back at the end
+                    scheduler = context.bot_data["scheduler"]
+                    archive_stats = await process_archive_upload(
+                        file, update, executor, lambda: scheduler.claim(update.effective_user.id), output_name, seed, target
+                    )
+                elif document.file_size and document.file_size > SPILL_THRESHOLD:
+                    # Large files go through unique temp files instead of being held in memory
+                    job_stats = await process_on_disk(file, update, executor, document.file_name, output_name, seed, previous, target)
+                else:
+                    # Download, process and upload entirely in memory
+                    job_stats = await process_in_memory(
+                        file, update, executor, context.bot_data["cache"], document.file_name, output_name, seed, previous, target
+                    )
+
+        if is_archive:
+            await update.message.reply_text(describe_archive(archive_stats, seed))
+            return
+
+        if "paragraphs" in job_stats:
+            paragraphs.update(update.effective_user.id, job_stats["paragraphs"])
+
         # Notify the user
-        await update.message.reply_text("Your file has been processed and plagiarism has been reduced.")
+        seed = job_stats["seed"]
+        reused = job_stats.get("paragraphs_reused", 0)
+        similarity = job_stats.get("similarity")
+        await update.message.reply_text(
+            "Your file has been processed and plagiarism has been reduced. "
+            + (f"Similarity to your original: {similarity:.0%}. " if similarity is not None else "")
+            + (f"{reused} unchanged paragraphs were kept from your earlier version. " if reused else "")
+            # Reused paragraphs came from earlier runs with other seeds, so a replay (which rewrites
+            # everything) can't reproduce this output
+            + (
+                f"Seed: {seed} (sending the same file with the caption \"seed {seed}\" rewrites every paragraph "
+                "afresh, so the result will differ from this one)."
+                if reused
+                else f"Seed: {seed} (send the same file with the caption \"seed {seed}\" to get this exact rewrite again)."
+                if EXACT_REPLAY
+                # Sentences reordered within the time budget vary from run to run
+                else f"Seed: {seed}."
+            )
+            + describe_overlaps(job_stats.get("overlaps"))
+        )
+        metrics.DOCUMENTS.inc(outcome="ok")
+
+    except archive.ArchiveError as e:
+        metrics.DOCUMENTS.inc(outcome="rejected")
+        await update.message.reply_text(str(e))
+
+    except QueueFullError:
+        # The job never ran, so it doesn't count towards the user's byte allowance
+        context.bot_data["scheduler"].refund(ticket)
+        metrics.DOCUMENTS.inc(outcome="busy")
+        await update.message.reply_text("The bot is busy right now. Please try again in a few minutes.")
 
     except Exception as e:
+        metrics.DOCUMENTS.inc(outcome="error")
         await update.message.reply_text(f"An error occurred: {e}")
 
+    finally:
+        context.bot_data["scheduler"].discard(ticket)
+        metrics.JOBS_IN_FLIGHT.dec()
+
+# Summary of the paragraphs that matched the reference corpus (the first few are listed)
+def describe_overlaps(overlaps: list, limit: int = 5) -> str:
+    if not overlaps:
+        return ""
+    listed = ", ".join(
+        f"paragraph {number} ({fraction:.0%} matches {source})" for number, fraction, source in overlaps[:limit]
+    )
+    more = f" and {len(overlaps) - limit} more" if len(overlaps) > limit else ""
+    return f"\n{len(overlaps)} paragraphs of your original overlap known sources: {listed}{more}."
+
+# Summary of a processed archive: documents rewritten, left out and failed
+def describe_archive(archive_stats: dict, seed: int = None, limit: int = 5) -> str:
+    done = len(archive_stats["documents"])
+    failed = [(name, error) for name, error in archive_stats["failed"] if error != archive.BUSY_REASON]
+    busy = len(archive_stats["failed"]) - len(failed)
+    lines = [f"Your archive has been processed: {done} documents rewritten."]
+    if archive_stats["skipped"]:
+        lines.append(f"{archive_stats['skipped']} files in an unsupported format were left out.")
+    if busy:
+        lines.append(f"{busy} documents were left out because the bot was busy. Please send them again in a few minutes.")
+    if failed:
+        listed = "; ".join(f"{name} ({error})" for name, error in failed[:limit])
+        more = f" and {len(failed) - limit} more" if len(failed) > limit else ""
+        lines.append(f"{len(failed)} documents could not be processed: {listed}{more}.")
+    if not EXACT_REPLAY:
+        lines.append("Sending the same archive again may give a slightly different rewrite." if seed is None else f"Seed: {seed}.")
+    elif seed is not None:
+        lines.append(f"Seed: {seed} (send the same archive with the caption \"seed {seed}\" to get this exact rewrite again).")
+    else:
+        lines.append("Each document was rewritten with its own seed; sending the same archive again gives the same rewrite.")
+    return "\n".join(lines)
+
+# Process a file without touching the disk, reusing a cached result when there is one;
+# returns the job's statistics (including the seed the rewrite used)
+async def process_in_memory(
+    file,
+    update: Update,
+    executor: JobExecutor,
+    cache: ResultCache,
+    name: str,
+    output_name: str,
+    seed: int = None,
+    previous: dict = None,
+    target: float = None,
+) -> dict:
+    with metrics.track("download"):
+        data = bytes(await file.download_as_bytearray())
+    metrics.BYTES.inc(len(data), direction="in")
+
+    # Reuse the result for a document we've already processed with the same settings and seed
+    seed = job_seed(data) if seed is None else seed
+    # The settings load the lexicon (and hash it) and the corpus index on first use, so they're built off
+    # the event loop
+    settings = await asyncio.to_thread(rewrite_settings)
+    key = cache.make_key(data, dict(settings, target=target, format=os.path.splitext(name)[1].lower()), seed)
+    cached = await cache.get(key)
+    if cached is not None:
+        processed, job_stats = cached
+        job_stats = dict(job_stats, seed=seed)
+    else:
+        with metrics.track("process"):
+            processed, job_stats = await executor.run(formats.process_bytes, data, name, seed, None, previous, target)
+        metrics.record_worker_stats(job_stats)
+        # A result that reused earlier paragraphs depends on more than this file and seed, so it isn't cached
+        if not job_stats.get("paragraphs_reused"):
+            await cache.put(key, processed, {name: job_stats[name] for name in CACHED_STATS if name in job_stats})
+
+    with metrics.track("upload"):
+        await update.message.reply_document(document=InputFile(io.BytesIO(processed), filename=output_name))
+    metrics.BYTES.inc(len(processed), direction="out")
+    return job_stats
+
+# Process a large file via per-request temp files; returns the job's statistics
+async def process_on_disk(
+    file,
+    update: Update,
+    executor: JobExecutor,
+    name: str,
+    output_name: str,
+    seed: int = None,
+    previous: dict = None,
+    target: float = None,
+) -> dict:
+    extension = os.path.splitext(name)[1].lower()
+    fd, file_path = tempfile.mkstemp(prefix="aibot_", suffix=extension)
+    os.close(fd)
+    processed_file_path = file_path[:-len(extension)] + "_processed" + os.path.splitext(output_name)[1]
+
+    try:
+        # Download the file
+        with metrics.track("download"):
+            await file.download_to_drive(file_path)
+        metrics.BYTES.inc(os.path.getsize(file_path), direction="in")
+
+        # Process the file in the worker pool so other chats aren't blocked
+        with metrics.track("process"):
+            job_stats = await executor.run(
+                formats.process_file, file_path, processed_file_path, name, seed, None, previous, target
+            )
+        metrics.record_worker_stats(job_stats)
+
+        # Send the processed file back to the user
+        with metrics.track("upload"), open(processed_file_path, 'rb') as f:
+            await update.message.reply_document(document=InputFile(f, filename=output_name))
+        metrics.BYTES.inc(os.path.getsize(processed_file_path), direction="out")
+        return job_stats
+
+    finally:
+        # Clean up temporary files
+        for path in (file_path, processed_file_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+# Process a ZIP of documents (see archive.process_archive) via temp files, editing one progress message as
+# documents finish; `claim()` gives the extra job slots documents beyond the first run on. Returns the
+# archive's statistics.
+async def process_archive_upload(
+    file,
+    update: Update,
+    executor: JobExecutor,
+    claim,
+    output_name: str,
+    seed: int = None,
+    target: float = None,
+) -> dict:
+    fd, file_path = tempfile.mkstemp(prefix="aibot_", suffix=archive.ARCHIVE_EXTENSION)
+    os.close(fd)
+    processed_file_path = file_path[:-len(archive.ARCHIVE_EXTENSION)] + "_processed" + archive.ARCHIVE_EXTENSION
+    progress_message = None
+    last_progress = 0.0
+
+    async def progress(done: int, total: int) -> None:
+        nonlocal progress_message, last_progress
+        now = time.monotonic()
+        try:
+            if progress_message is None:
+                progress_message = await update.message.reply_text(f"Found {total} documents. Rewriting them now...")
+            elif done == total or now - last_progress >= ARCHIVE_PROGRESS_INTERVAL:
+                await progress_message.edit_text(f"Rewritten {done} of {total} documents...")
+            else:
+                return
+        except TelegramError as e:
+            # A lost progress message (rate limit, edit conflict) shouldn't fail the archive
+            logger.warning("Could not update archive progress: %s", e)
+        last_progress = now
+
+    try:
+        with metrics.track("download"):
+            await file.download_to_drive(file_path)
+        metrics.BYTES.inc(os.path.getsize(file_path), direction="in")
+
+        with metrics.track("process"):
+            archive_stats = await archive.process_archive(
+                file_path, processed_file_path, executor, seed, target, progress, claim
+            )
+        for _, job_stats in archive_stats["documents"]:
+            metrics.record_worker_stats(job_stats)
+            metrics.DOCUMENTS.inc(outcome="ok")
+        busy = sum(1 for _, error in archive_stats["failed"] if error == archive.BUSY_REASON)
+        metrics.DOCUMENTS.inc(busy, outcome="busy")
+        metrics.DOCUMENTS.inc(len(archive_stats["failed"]) - busy, outcome="error")
+
+        if archive_stats["documents"]:
+            with metrics.track("upload"), open(processed_file_path, 'rb') as f:
+                await update.message.reply_document(document=InputFile(f, filename=output_name))
+            metrics.BYTES.inc(os.path.getsize(processed_file_path), direction="out")
+        return archive_stats
+
     finally:
         # Clean up temporary files
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if processed_file_path and os.path.exists(processed_file_path):
-            os.remove(processed_file_path)
-
-# Process the .docx file
-def process_docx(file_path: str) -> str:
-    # Read the .docx file
-    doc = Document(file_path)
-
-    # Create a new document to store the rewritten content
-    new_doc = Document()
-
-    # Iterate through each paragraph in the original document
-    for para in doc.paragraphs:
-        # Preserve paragraph style (e.g., headings, bullet points)
-        new_para = new_doc.add_paragraph(style=para.style)
-
-        # Rewrite the text while preserving formatting
-        for run in para.runs:
-            rewritten_text = rewrite_text(run.text)  # Rewrite the text
-            new_run = new_para.add_run(rewritten_text)
-
-            # Preserve formatting (bold, italic, underline, font size, font type)
-            new_run.bold = run.bold
-            new_run.italic = run.italic
-            new_run.underline = run.underline
-            new_run.font.name = run.font.name
-            new_run.font.size = run.font.size
-
-    # Save the new document
-    new_file_path = f"processed_{os.path.basename(file_path)}"
-    new_doc.save(new_file_path)
-
-    return new_file_path
-
-# Advanced rule-based text rewriting
-def rewrite_text(text: str) -> str:
-    # Split the text into sentences
-    sentences = text.split(". ")
-
-    # Rewrite each sentence
-    rewritten_sentences = []
-    for sentence in sentences:
-        if sentence.strip():  # Skip empty sentences
-            rewritten_sentence = rewrite_sentence(sentence)
-            rewritten_sentences.append(rewritten_sentence)
-
-    # Join the rewritten sentences
-    return ". ".join(rewritten_sentences)
-
-# Rewrite a single sentence
-def rewrite_sentence(sentence: str) -> str:
-    # Split the sentence into words
-    words = sentence.split()
-
-    # Apply rewriting rules
-    rewritten_words = []
-    for word in words:
-        # Randomly replace words with synonyms
-        if random.random() < 0.3:  # 30% chance to replace a word
-            synonym = get_synonym(word)
-            rewritten_words.append(synonym)
-        else:
-            rewritten_words.append(word)
-
-    # Randomly shuffle the order of words (optional)
-    if random.random() < 0.2:  # 20% chance to shuffle words
-        random.shuffle(rewritten_words)
-
-    # Join the words into a sentence
-    return " ".join(rewritten_words)
-
-# Get a synonym for a word (simple example)
-def get_synonym(word: str) -> str:
-    synonym_map = {
-        "student": "learner",
-        "university": "college",
-        "education": "learning",
-        "knowledge": "understanding",
-        "research": "investigation",
-        "study": "analysis",
-        "assignment": "task",
-        "project": "undertaking",
-        "professor": "lecturer",
-        "lecture": "class",
-        "campus": "grounds",
-        "degree": "qualification",
-        "course": "program",
-        "textbook": "manual",
-        "library": "archive",
-        "exam": "test",
-        "grade": "mark",
-        "scholarship": "grant",
-        "tuition": "fee",
-        "dormitory": "hostel",
-        "roommate": "housemate",
-        "cafeteria": "dining hall",
-        "graduation": "commencement",
-        "diploma": "certificate",
-        "thesis": "dissertation",
-        "internship": "apprenticeship",
-        "semester": "term",
-        "curriculum": "syllabus",
-        "faculty": "staff",
-        "department": "division",
-        "major": "specialization",
-        "minor": "secondary focus",
-        "lecturer": "instructor",
-        "tutor": "mentor",
-        "peer": "colleague",
-        "assignment": "homework",
-        "deadline": "due date",
-        "plagiarism": "academic dishonesty",
-        "citation": "reference",
-        "bibliography": "reference list",
-        "abstract": "summary",
-        "hypothesis": "assumption",
-        "methodology": "approach",
-        "data": "information",
-        "analysis": "evaluation",
-        "conclusion": "finding",
-        "argument": "claim",
-        "evidence": "proof",
-        "theory": "concept",
-        "principle": "rule",
-        "phenomenon": "occurrence",
-        "variable": "factor",
-        "experiment": "trial",
-        "observation": "monitoring",
-        "result": "outcome",
-        "discussion": "debate",
-        "recommendation": "suggestion",
-        "limitation": "constraint",
-        "implication": "consequence",
-        "framework": "structure",
-        "model": "representation",
-        "paradigm": "pattern",
-        "perspective": "viewpoint",
-        "context": "background",
-        "scope": "range",
-        "objective": "goal",
-        "strategy": "plan",
-        "technique": "method",
-        "tool": "instrument",
-        "resource": "asset",
-        "contribution": "input",
-        "impact": "effect",
-        "trend": "pattern",
-        "issue": "problem",
-        "challenge": "difficulty",
-        "solution": "answer",
-        "innovation": "invention",
-        "creativity": "originality",
-        "collaboration": "cooperation",
-        "communication": "interaction",
-        "presentation": "delivery",
-        "publication": "release",
-        "journal": "periodical",
-        "article": "paper",
-        "author": "writer",
-        "editor": "reviewer",
-        "review": "evaluation",
-        "feedback": "response",
-        "revision": "amendment",
-        "draft": "version",
-        "final": "completed",
-        "submission": "entry",
-        "approval": "acceptance",
-        "rejection": "denial",
-        "criticism": "critique",
-        "improvement": "enhancement",
-        "progress": "advancement",
-        "achievement": "accomplishment",
-        "success": "triumph",
-        "failure": "defeat",
-        "motivation": "drive",
-        "inspiration": "stimulus",
-        "dedication": "commitment",
-        "effort": "endeavor",
-        "hard work": "diligence",
-        "persistence": "determination",
-        "resilience": "toughness",
-        "adaptability": "flexibility",
-        "initiative": "enterprise",
-        "leadership": "guidance",
-        "teamwork": "collaboration",
-        "ethics": "morality",
-        "integrity": "honesty",
-        "responsibility": "accountability",
-        "discipline": "self-control",
-        "time management": "scheduling",
-        "organization": "arrangement",
-        "priority": "importance",
-        "efficiency": "productivity",
-        "effectiveness": "competence",
-        "quality": "standard",
-        "excellence": "superiority",
-        "performance": "execution",
-        "assessment": "appraisal",
-        "evaluation": "judgment",
-        "measurement": "quantification",
-        "benchmark": "standard",
-        "indicator": "signal",
-        "criterion": "requirement",
-        "standard": "norm",
-        "expectation": "anticipation",
-        "satisfaction": "fulfillment",
-        "dissatisfaction": "discontent",
-        "frustration": "disappointment",
-        "stress": "pressure",
-        "anxiety": "worry",
-        "pressure": "strain",
-        "burnout": "exhaustion",
-        "balance": "equilibrium",
-        "well-being": "health",
-        "mental health": "psychological state",
-        "physical health": "bodily condition",
-        "nutrition": "diet",
-        "exercise": "workout",
-        "sleep": "rest",
-        "relaxation": "unwinding",
-        "hobby": "pastime",
-        "interest": "curiosity",
-        "passion": "enthusiasm",
-        "goal": "objective",
-        "dream": "aspiration",
-        "ambition": "desire",
-        "career": "profession",
-        "job": "employment",
-        "work": "labor",
-        "employer": "boss",
-        "employee": "worker",
-        "colleague": "coworker",
-        "supervisor": "manager",
-        "mentor": "guide",
-        "role model": "example",
-        "network": "connections",
-        "opportunity": "chance",
-        "challenge": "obstacle",
-        "competition": "rivalry",
-        "market": "industry",
-        "economy": "financial system",
-        "globalization": "internationalization",
-        "technology": "innovation",
-        "digital": "electronic",
-        "internet": "web",
-        "social media": "online platforms",
-        "communication": "interaction",
-        "information": "data",
-        "knowledge": "understanding",
-        "learning": "education",
-        "skill": "ability",
-        "experience": "practice",
-        "expertise": "proficiency",
-        "competence": "capability",
-        "qualification": "credential",
-        "certification": "accreditation",
-        "license": "permit",
-        "training": "instruction",
-        "development": "growth",
-        "improvement": "enhancement",
-        "progress": "advancement",
-        "success": "achievement",
-        "failure": "setback",
-        "mistake": "error",
-        "lesson": "teaching",
-        "feedback": "response",
-        "criticism": "evaluation",
-        "praise": "compliment",
-        "recognition": "acknowledgment",
-        "reward": "prize",
-        "punishment": "penalty",
-        "discipline": "control",
-        "motivation": "drive",
-        "inspiration": "stimulus",
-        "creativity": "originality",
-        "innovation": "invention",
-        "problem": "issue",
-        "solution": "answer",
-        "decision": "choice",
-        "strategy": "plan",
-        "plan": "scheme",
-        "goal": "objective",
-        "objective": "aim",
-        "purpose": "intention",
-        "mission": "goal",
-        "vision": "dream",
-        "value": "principle",
-        "belief": "conviction",
-        "attitude": "mindset",
-        "behavior": "conduct",
-        "habit": "routine",
-        "culture": "tradition",
-        "diversity": "variety",
-        "inclusion": "integration",
-        "equality": "fairness",
-        "justice": "fairness",
-        "right": "entitlement",
-        "responsibility": "duty",
-        "ethics": "morality",
-        "integrity": "honesty",
-        "trust": "confidence",
-        "respect": "esteem",
-        "honor": "dignity",
-        "reputation": "standing",
-        "image": "perception",
-        "identity": "self",
-        "personality": "character",
-        "emotion": "feeling",
-        "mood": "temperament",
-        "happiness": "joy",
-        "sadness": "sorrow",
-        "anger": "fury",
-        "fear": "anxiety",
-        "love": "affection",
-        "hate": "dislike",
-        "friendship": "companionship",
-        "relationship": "connection",
-        "family": "household",
-        "parent": "guardian",
-        "child": "offspring",
-        "sibling": "brother/sister",
-        "partner": "companion",
-        "marriage": "union",
-        "divorce": "separation",
-        "community": "society",
-        "neighbor": "local",
-        "citizen": "resident",
-        "government": "administration",
-        "politics": "governance",
-        "policy": "regulation",
-        "law": "rule",
-        "justice": "fairness",
-        "crime": "offense",
-        "punishment": "penalty",
-        "freedom": "liberty",
-        "right": "entitlement",
-        "responsibility": "duty",
-        "duty": "obligation",
-        "service": "assistance",
-        "volunteer": "helper",
-        "charity": "philanthropy",
-        "donation": "contribution",
-        "support": "assistance",
-        "help": "aid",
-        "care": "attention",
-        "health": "well-being",
-        "medicine": "treatment",
-        "doctor": "physician",
-        "patient": "sufferer",
-        "hospital": "clinic",
-        "disease": "illness",
-        "symptom": "indication",
-        "treatment": "therapy",
-        "recovery": "healing",
-        "prevention": "avoidance",
-        "vaccine": "immunization",
-        "epidemic": "outbreak",
-        "pandemic": "global outbreak",
-        "environment": "surroundings",
-        "nature": "wildlife",
-        "pollution": "contamination",
-        "climate": "weather",
-        "change": "transformation",
-        "global warming": "climate change",
-        "sustainability": "endurance",
-        "conservation": "preservation",
-        "energy": "power",
-        "resource": "asset",
-        "waste": "garbage",
-        "recycling": "reuse",
-        "technology": "innovation",
-        "science": "knowledge",
-        "research": "investigation",
-        "discovery": "finding",
-        "invention": "creation",
-        "experiment": "trial",
-        "observation": "monitoring",
-        "data": "information",
-        "analysis": "evaluation",
-        "conclusion": "result",
-        "theory": "hypothesis",
-        "principle": "rule",
-        "law": "regulation",
-        "fact": "truth",
-        "evidence": "proof",
-        "argument": "claim",
-        "debate": "discussion",
-        "opinion": "view",
-        "belief": "conviction",
-        "truth": "reality",
-        "lie": "falsehood",
-        "honesty": "integrity",
-        "trust": "confidence",
-        "doubt": "skepticism",
-        "certainty": "confidence",
-        "uncertainty": "doubt",
-        "risk": "danger",
-        "safety": "security",
-        "danger": "hazard",
-        "threat": "risk",
-        "protection": "defense",
-        "security": "safety",
-        "fear": "anxiety",
-        "courage": "bravery",
-        "hope": "optimism",
-        "despair": "hopelessness",
-        "faith": "belief",
-        "religion": "spirituality",
-        "spirituality": "faith",
-        "prayer": "meditation",
-        "worship": "devotion",
-        "god": "deity",
-        "angel": "messenger",
-        "devil": "demon",
-        "heaven": "paradise",
-        "hell": "underworld",
-        "soul": "spirit",
-        "life": "existence",
-        "death": "demise",
-        "birth": "beginning",
-        "rebirth": "reincarnation",
-        "eternity": "infinity",
-        "time": "duration",
-        "past": "history",
-        "present": "now",
-        "future": "tomorrow",
-        "age": "era",
-        "generation": "epoch",
-        "century": "hundred years",
-        "decade": "ten years",
-        "year": "twelve months",
-        "month": "four weeks",
-        "week": "seven days",
-        "day": "twenty-four hours",
-        "hour": "sixty minutes",
-        "minute": "sixty seconds",
-        "second": "moment",
-        "moment": "instant",
-        "history": "past",
-        "tradition": "custom",
-        "culture": "heritage",
-        "art": "creativity",
-        "music": "melody",
-        "dance": "movement",
-        "theater": "drama",
-        "film": "movie",
-        "literature": "writing",
-        "poetry": "verse",
-        "story": "tale",
-        "novel": "book",
-        "author": "writer",
-        "reader": "audience",
-        "language": "tongue",
-        "word": "term",
-        "sentence": "phrase",
-        "paragraph": "section",
-        "chapter": "part",
-        "book": "volume",
-        "library": "archive",
-        "knowledge": "wisdom",
-        "wisdom": "insight",
-        "intelligence": "smarts",
-        "smart": "clever",
-        "stupid": "foolish",
-        "genius": "prodigy",
-        "idiot": "fool",
-        "expert": "specialist",
-        "amateur": "beginner",
-        "professional": "expert",
-        "work": "labor",
-        "job": "occupation",
-        "career": "profession",
-        "business": "enterprise",
-        "company": "firm",
-        "organization": "institution",
-        "team": "group",
-        "leader": "manager",
-        "manager": "supervisor",
-        "boss": "employer",
-        "employee": "worker",
-        "colleague": "coworker",
-        "partner": "associate",
-        "client": "customer",
-        "customer": "buyer",
-        "consumer": "user",
-        "product": "item",
-        "service": "assistance",
-        "price": "cost",
-        "cost": "expense",
-        "value": "worth",
-        "profit": "gain",
-        "loss": "deficit",
-        "money": "currency",
-        "wealth": "riches",
-        "poverty": "destitution",
-        "rich": "wealthy",
-        "poor": "needy",
-        "economy": "financial system",
-        "market": "industry",
-        "trade": "commerce",
-        "export": "shipment",
-        "import": "purchase",
-        "investment": "funding",
-        "stock": "share",
-        "bond": "security",
-        "bank": "financial institution",
-        "loan": "credit",
-        "debt": "liability",
-        "interest": "return",
-        "tax": "levy",
-        "income": "earnings",
-        "salary": "wage",
-        "wage": "pay",
-        "payment": "remittance",
-        "bill": "invoice",
-        "expense": "cost",
-        "budget": "plan",
-        "saving": "reserve",
-        "spending": "expenditure",
-        "wealth": "fortune",
-        "poverty": "hardship",
-        "inequality": "disparity",
-        "justice": "fairness",
-        "injustice": "unfairness",
-        "corruption": "dishonesty",
-        "scandal": "controversy",
-        "crime": "offense",
-        "law": "regulation",
-        "police": "law enforcement",
-        "court": "tribunal",
-        "judge": "magistrate",
-        "lawyer": "attorney",
-        "trial": "hearing",
-        "verdict": "decision",
-        "guilty": "culpable",
-        "innocent": "blameless",
-        "punishment": "penalty",
-        "prison": "jail",
-        "freedom": "liberty",
-        "slavery": "bondage",
-        "war": "conflict",
-        "peace": "harmony",
-        "violence": "aggression",
-        "terrorism": "extremism",
-        "attack": "assault",
-        "defense": "protection",
-        "soldier": "warrior",
-        "army": "military",
-        "weapon": "armament",
-        "bomb": "explosive",
-        "gun": "firearm",
-        "knife": "blade",
-        "fight": "battle",
-        "victory": "triumph",
-        "defeat": "loss",
-        "enemy": "foe",
-        "ally": "partner",
-        "friend": "companion",
-        "stranger": "unknown",
-        "neighbor": "local",
-        "community": "society",
-        "nation": "country",
-        "state": "province",
-        "city": "town",
-        "village": "hamlet",
-        "home": "residence",
-        "house": "dwelling",
-        "apartment": "flat",
-        "room": "chamber",
-        "kitchen": "cooking area",
-        "bathroom": "washroom",
-        "bedroom": "sleeping area",
-        "living room": "sitting room",
-        "furniture": "appliance",
-        "table": "desk",
-        "chair": "seat",
-        "bed": "cot",
-        "sofa": "couch",
-        "lamp": "light",
-        "window": "opening",
-        "door": "entrance",
-        "wall": "barrier",
-        "floor": "ground",
-        "ceiling": "roof",
-        "garden": "yard",
-        "tree": "plant",
-        "flower": "blossom",
-        "grass": "lawn",
-        "animal": "creature",
-        "dog": "canine",
-        "cat": "feline",
-        "bird": "avian",
-        "fish": "aquatic animal",
-        "horse": "equine",
-        "cow": "bovine",
-        "sheep": "ovine",
-        "pig": "swine",
-        "chicken": "poultry",
-        "egg": "ovum",
-        "milk": "dairy",
-        "meat": "flesh",
-        "vegetable": "plant",
-        "fruit": "produce",
-        "grain": "cereal",
-        "bread": "loaf",
-        "rice": "staple",
-        "pasta": "noodles",
-        "soup": "broth",
-        "salad": "greens",
-        "sandwich": "snack",
-        "pizza": "pie",
-        "burger": "sandwich",
-        "fries": "chips",
-        "dessert": "sweet",
-        "cake": "pastry",
-        "cookie": "biscuit",
-        "chocolate": "candy",
-        "ice cream": "frozen dessert",
-        "drink": "beverage",
-        "water": "H2O",
-        "juice": "liquid",
-        "soda": "pop",
-        "coffee": "brew",
-        "tea": "infusion",
-        "alcohol": "liquor",
-        "beer": "ale",
-        "wine": "vino",
-        "whiskey": "spirit",
-        "vodka": "liquor",
-        "restaurant": "eatery",
-        "cafe": "coffee shop",
-        "bar": "pub",
-        "hotel": "inn",
-        "motel": "lodging",
-        "resort": "retreat",
-        "vacation": "holiday",
-        "travel": "journey",
-        "trip": "excursion",
-        "flight": "air travel",
-        "airport": "terminal",
-        "train": "rail",
-        "station": "depot",
-        "bus": "coach",
-        "car": "automobile",
-        "bike": "bicycle",
-        "motorcycle": "motorbike",
-        "truck": "lorry",
-        "ship": "vessel",
-        "boat": "craft",
-        "plane": "aircraft",
-        "renewable": "sustainable",
-"waste": "garbage",
-"recycling": "reuse",
-"water": "H2O",
-"air": "atmosphere",
-"soil": "earth",
-"forest": "woodland",
-"wildlife": "fauna",
-"agriculture": "farming",
-"food": "nutrition",
-"health": "well-being",
-"medicine": "treatment",
-"disease": "illness",
-"diagnosis": "identification",
-"treatment": "therapy",
-"prevention": "precaution",
-"recovery": "rehabilitation",
-"argument": "claim",
-"evidence": "proof",
-"conclusion": "inference",
-"finding": "discovery",
-"implication": "consequence",
-"context": "background",
-"perspective": "viewpoint",
-"interpretation": "explanation",
-"justification": "rationale",
-"critique": "evaluation",
-"observation": "monitoring",
-"phenomenon": "occurrence",
-"trend": "pattern",
-"correlation": "relationship",
-"causation": "cause-and-effect",
-"sample": "subset",
-"population": "group",
-"bias": "prejudice",
-"validity": "credibility",
-"reliability": "consistency",
-"accuracy": "precision",
-"efficiency": "effectiveness",
-"analysis": "scrutiny",
-"comparison": "contrast",
-"impact": "effect",
-"influence": "persuasion",
-"factor": "element",
-"significance": "importance",
-"cause": "reason",
-"effect": "consequence",
-"debate": "discussion",
-"policy": "regulation",
-"law": "legislation",
-"framework": "structure",
-"criterion": "standard",
-"requirement": "necessity",
-"recommendation": "suggestion",
-"proposal": "plan",
-"business": "enterprise",
-"company": "corporation",
-"industry": "sector",
-"management": "administration",
-"leadership": "guidance",
-"communication": "interaction",
-"collaboration": "cooperation",
-"negotiation": "discussion",
-"employment": "occupation",
-"job": "profession",
-"employee": "worker",
-"employer": "supervisor",
-"productivity": "efficiency",
-"motivation": "inspiration",
-"performance": "output",
-"evaluation": "assessment",
-"feedback": "response",
-"learning": "education",
-"knowledge": "awareness",
-"understanding": "comprehension",
-"cognition": "perception",
-"skill": "competency",
-"training": "instruction",
-"experience": "expertise",
-"qualification": "credential",
-"support": "assistance",
-"resource": "asset",
-"environment": "surroundings",
-"sustainability": "eco-friendliness",
-"pollution": "contamination",
-"conservation": "preservation",
-"climate": "weather",
-"biodiversity": "ecosystem",
-"energy": "power",
-"renewable": "sustainable",
-"waste": "garbage",
-"recycling": "reuse",
-"water": "H2O",
-"air": "atmosphere",
-"soil": "earth",
-"forest": "woodland",
-"wildlife": "fauna",
-"agriculture": "farming",
-"food": "nutrition",
-"health": "well-being",
-"medicine": "treatment",
-"disease": "illness",
-"diagnosis": "identification",
-"treatment": "therapy",
-"prevention": "precaution",
-"recovery": "rehabilitation",
-"argument": "claim",
-"evidence": "proof",
-"conclusion": "inference",
-"finding": "discovery",
-"implication": "consequence",
-"context": "background",
-"perspective": "viewpoint",
-"interpretation": "explanation",
-"justification": "rationale",
-"critique": "evaluation",
-"observation": "monitoring",
-"phenomenon": "occurrence",
-"trend": "pattern",
-"correlation": "relationship",
-"causation": "cause-and-effect",
-"sample": "subset",
-"population": "group",
-"bias": "prejudice",
-"validity": "credibility",
-"reliability": "consistency",
-"accuracy": "precision",
-"efficiency": "effectiveness",
-"analysis": "scrutiny",
-"comparison": "contrast",
-"impact": "effect",
-"influence": "persuasion",
-"factor": "element",
-"significance": "importance",
-"cause": "reason",
-"effect": "consequence",
-"debate": "discussion",
-"policy": "regulation",
-"law": "legislation",
-"framework": "structure",
-"criterion": "standard",
-"requirement": "necessity",
-"recommendation": "suggestion",
-"proposal": "plan",
-"business": "enterprise",
-"company": "corporation",
-"industry": "sector",
-"management": "administration",
-"leadership": "guidance",
-"communication": "interaction",
-"collaboration": "cooperation",
-"negotiation": "discussion",
-"employment": "occupation",
-"job": "profession",
-"employee": "worker",
-"employer": "supervisor",
-"productivity": "efficiency",
-"motivation": "inspiration",
-"performance": "output",
-"evaluation": "assessment",
-"feedback": "response",
-"learning": "education",
-"knowledge": "awareness",
-"understanding": "comprehension",
-"cognition": "perception",
-"skill": "competency",
-"training": "instruction",
-"experience": "expertise",
-"qualification": "credential",
-"support": "assistance",
-"resource": "asset",
-"environment": "surroundings",
-"sustainability": "eco-friendliness",
-"pollution": "contamination",
-"conservation": "preservation",
-"climate": "weather",
-"biodiversity": "ecosystem",
-"energy": "power",
-"renewable": "sustainable",
-"waste": "garbage",
-"recycling": "reuse",
-"water": "H2O",
-"air": "atmosphere",
-"soil": "earth",
-"forest": "woodland",
-"wildlife": "fauna",
-"agriculture": "farming",
-"food": "nutrition",
-"health": "well-being",
-"medicine": "treatment",
-"disease": "illness",
-"diagnosis": "identification",
-"treatment": "therapy",
-"prevention": "precaution",
-"recovery": "rehabilitation",
-"argument": "claim",
-"evidence": "proof",
-"conclusion": "inference",
-"finding": "discovery",
-"implication": "consequence",
-"context": "background",
-"perspective": "viewpoint",
-"interpretation": "explanation",
-"justification": "rationale",
-"critique": "evaluation",
-"observation": "monitoring",
-"phenomenon": "occurrence",
-"trend": "pattern",
-"correlation": "relationship",
-"causation": "cause-and-effect",
-"sample": "subset",
-"population": "group",
-"bias": "prejudice",
-"validity": "credibility",
-"reliability": "consistency",
-"accuracy": "precision",
-"efficiency": "effectiveness",
-"analysis": "scrutiny",
-"comparison": "contrast",
-"impact": "effect",
-"influence": "persuasion",
-"factor": "element",
-"significance": "importance",
-"cause": "reason",
-"effect": "consequence",
-"debate": "discussion",
-"policy": "regulation",
-"law": "legislation",
-"framework": "structure",
-"criterion": "standard",
-"requirement": "necessity",
-"recommendation": "suggestion",
-"proposal": "plan",
-"business": "enterprise",
-"company": "corporation",
-"industry": "sector",
-"management": "administration",
-"leadership": "guidance",
-"communication": "interaction",
-"collaboration": "cooperation",
-"negotiation": "discussion",
-"employment": "occupation",
-"job": "profession",
-"employee": "worker",
-"employer": "supervisor",
-"productivity": "efficiency",
-"motivation": "inspiration",
-"performance": "output",
-"evaluation": "assessment",
-"feedback": "response",
-"learning": "education",
-"knowledge": "awareness",
-"understanding": "comprehension",
-"cognition": "perception",
-"skill": "competency",
-"training": "instruction",
-"experience": "expertise",
-"qualification": "credential",
-"support": "assistance",
-"resource": "asset",
-"environment": "surroundings",
-"sustainability": "eco-friendliness",
-"pollution": "contamination",
-"conservation": "preservation",
-"climate": "weather",
-"biodiversity": "ecosystem",
-"energy": "power",
-"renewable": "sustainable",
-"waste": "garbage",
-"recycling": "reuse",
-"water": "H2O",
-"air": "atmosphere",
-"soil": "earth",
-"forest": "woodland",
-"wildlife": "fauna",
-"agriculture": "farming",
-"food": "nutrition",
-"health": "well-being",
-"medicine": "treatment",
-"disease": "illness",
-"diagnosis": "identification",
-"treatment": "therapy",
-"prevention": "precaution",
-"recovery": "rehabilitation"
-
-
-    }
-    return synonym_map.get(word.lower(), word)
+        for path in (file_path, processed_file_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+# Start the metrics endpoint once the bot is initialised, and pre-warm when PREWARM is set
+async def post_init(application: Application) -> None:
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if PREWARM:
+        application.bot_data["prewarm"] = asyncio.create_task(prewarm(application.bot_data["executor"]))
+
+# Warm up this process off the event loop, then start the worker processes (which inherit or load
+# the same state) so the first document finds everything ready
+async def prewarm(executor: JobExecutor) -> None:
+    started = time.perf_counter()
+    await asyncio.to_thread(warm_up)
+    if executor.kind == "process":
+        await executor.run(warm_up)
+    logger.info("Pre-warmed in %.2fs", time.perf_counter() - started)
+
+# Stop the worker pool and metrics endpoint when the bot shuts down
+async def post_shutdown(application: Application) -> None:
+    application.bot_data["executor"].shutdown()
+    if "metrics_server" in application.bot_data:
+        await application.bot_data["metrics_server"].cleanup()
 
 # Main function to start the bot
 async def main() -> None:
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # Allow re-entrant event loops (run_polling runs its own loop inside this one; also for Jupyter/IDEs)
+    import nest_asyncio
+
+    nest_asyncio.apply()
+
+    # Create the Application (updates are handled concurrently so one document doesn't block other chats)
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(UPDATE_WORKERS)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = builder.build()
+
+    # Worker pool for the CPU-heavy document rewrites
+    application.bot_data["executor"] = JobExecutor.from_env()
+
+    # Fair per-user job queue in front of the worker pool
+    application.bot_data["scheduler"] = FairScheduler.from_env(application.bot_data["executor"].max_workers)
+
+    # Cache of processed documents, keyed by content and rewrite settings
+    application.bot_data["cache"] = ResultCache.from_env()
+
+    # Rewritten paragraphs per user, so a revised document only has its edits rewritten
+    application.bot_data["paragraphs"] = ParagraphStore.from_env()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", stats))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
 
     # Start the bot
-    await application.run_polling()
+    if BOT_MODE == 'webhook':
+        from webhook import run_webhook
+
+        await run_webhook(
+            application,
+            listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8080')),
+            path=os.getenv('WEBHOOK_PATH', '/telegram'),
+            webhook_url=os.getenv('WEBHOOK_URL'),
+            secret_token=os.getenv('WEBHOOK_SECRET'),
+        )
+    else:
+        await application.run_polling()
 
 if __name__ == '__main__':
-    import asyncio
-
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
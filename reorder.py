@@ -0,0 +1,323 @@
+import os
+import re
+import time
+
+from tokenizer import WORD_RE
+
+# Reorder strategies tried on the sentences picked for reordering, in a random order per sentence
+DEFAULT_STRATEGIES = ("clause_swap", "passive", "phrase")
+REORDER_STRATEGIES = tuple(
+    name.strip() for name in os.getenv("REORDER_STRATEGIES", ",".join(DEFAULT_STRATEGIES)).split(",") if name.strip()
+)
+# Time reordering may take per document in milliseconds (0 = no limit). Sentences reached after
+# the budget is spent are left in their original order; this makes the output depend on timing,
+# so leave it at 0 when seeded rewrites must be reproducible (with a budget the bot doesn't offer
+# exact replays, and the budget is part of the cache key).
+REORDER_BUDGET_MS = float(os.getenv("REORDER_BUDGET_MS", "0"))
+
+DETERMINERS = ("the", "a", "an", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our", "their")
+# Subject pronoun -> object pronoun, and back ("she wrote it" <-> "it was written by her")
+OBJECT_PRONOUNS = {"i": "me", "we": "us", "they": "them", "he": "him", "she": "her", "you": "you", "it": "it"}
+SUBJECT_PRONOUNS = {value: key for key, value in OBJECT_PRONOUNS.items()}
+PLURAL_PRONOUNS = frozenset(("we", "they", "you"))
+
+# Words a clause can start with that are safe to lower-case when the clause moves out of first
+# place. Anything else (names, acronyms) stays where it is, so clauses starting with one aren't moved.
+LOWERCASE_STARTERS = frozenset(
+    DETERMINERS
+    + ("we", "they", "he", "she", "it", "you", "there", "one", "some", "many", "most", "all", "each",
+       "every", "both", "several", "few", "no", "such", "other", "others", "people", "students")
+)
+# Verbs whose object can be an if/when clause ("I wonder if ..."), which can't be moved
+COMPLEMENT_VERBS = frozenset((
+    "ask", "asked", "asks", "wonder", "wondered", "wonders", "know", "knew", "knows", "see", "saw",
+    "check", "checked", "tell", "told", "decide", "decided", "sure", "unsure", "doubt", "remember",
+))
+# Words between a determiner and "and" that aren't the first of two coordinated nouns
+FUNCTION_WORDS = frozenset(
+    DETERMINERS + tuple(OBJECT_PRONOUNS) + tuple(SUBJECT_PRONOUNS)
+    + ("and", "or", "but", "not", "then", "so", "also", "is", "are", "was", "were", "be", "been", "has",
+       "have", "had", "do", "does", "did", "of", "to", "in", "on", "at", "for", "with", "by", "from")
+)
+
+# Irregular past tense -> past participle (regular verbs ending in -ed are the same in both)
+PARTICIPLES = {
+    "wrote": "written", "took": "taken", "gave": "given", "saw": "seen", "made": "made", "found": "found",
+    "built": "built", "ate": "eaten", "drew": "drawn", "chose": "chosen", "broke": "broken", "drove": "driven",
+    "began": "begun", "sent": "sent", "bought": "bought", "taught": "taught", "caught": "caught",
+    "held": "held", "led": "led", "left": "left", "paid": "paid", "sold": "sold", "told": "told",
+    "won": "won", "wore": "worn", "stole": "stolen", "spoke": "spoken", "threw": "thrown", "knew": "known",
+    "showed": "shown", "grew": "grown", "hid": "hidden", "shook": "shaken", "forgot": "forgotten",
+    "brought": "brought", "kept": "kept", "lost": "lost", "met": "met", "heard": "heard", "sang": "sung",
+    "rang": "rung", "struck": "struck", "understood": "understood", "wrapped": "wrapped",
+}
+PAST_TENSES = {participle: past for past, participle in PARTICIPLES.items()}
+# Words ending in -ed that aren't transitive past tenses
+NOT_PAST_TENSES = frozenset((
+    "need", "seed", "speed", "breed", "hundred", "kindred", "naked", "wicked", "sacred", "bored", "tired",
+    "seemed", "appeared", "remained", "looked", "sounded", "felt", "smelled", "tasted", "became", "proceed",
+    "succeed", "exceed", "indeed", "embed",
+))
+# Nouns ending in s that are singular
+SINGULAR_NOUNS = frozenset(("news", "series", "species", "physics", "mathematics", "economics", "analysis", "basis", "thesis", "crisis"))
+
+SUBORDINATORS = (
+    "even though", "as soon as", "because", "although", "though", "whenever", "when", "if", "since",
+    "unless", "while", "after", "before", "once",
+)
+MONTHS = ("January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December")
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+TIME_PHRASE = (
+    rf"(?:in\s+\d{{4}}|in\s+(?:{'|'.join(MONTHS)})(?:\s+\d{{4}})?|on\s+(?:{'|'.join(DAYS)})"
+    r"|(?:last|next|this)\s+(?:week|month|year|semester|term|summer|winter|spring|autumn|fall)"
+    r"|every\s+(?:day|week|month|year)|in\s+the\s+(?:morning|afternoon|evening)|yesterday|today|tomorrow)"
+)
+
+# Pattern tables, compiled once when the module is imported. Clauses never contain commas,
+# semicolons, colons or quotes, so only simple sentences are restructured.
+CLAUSE = r"[^,;:\"“”]+?"
+DETERMINER = rf"(?:{'|'.join(DETERMINERS)})"
+NOUN_PHRASE = rf"{DETERMINER}\s+\w+(?:\s+\w+)?"
+PRONOUN = rf"(?:{'|'.join(OBJECT_PRONOUNS)})"
+OBJECT_PRONOUN = rf"(?:{'|'.join(SUBJECT_PRONOUNS)})"
+END = r"([.?!…]*)$"
+
+CLAUSE_PATTERNS = (
+    # "Because it rained, we stayed inside." -> "We stayed inside because it rained."
+    ("leading", re.compile(rf"^({'|'.join(SUBORDINATORS)})\s+({CLAUSE}),\s+({CLAUSE}){END}", re.IGNORECASE)),
+    # "We stayed inside because it rained." -> "Because it rained, we stayed inside."
+    ("trailing", re.compile(rf"^({CLAUSE}),?\s+({'|'.join(SUBORDINATORS)})\s+({CLAUSE}){END}")),
+)
+VOICE_PATTERNS = (
+    # "The committee approved the plan." -> "The plan was approved by the committee."
+    ("active", re.compile(rf"^({NOUN_PHRASE}|{PRONOUN})\s+(\w+)\s+({NOUN_PHRASE}|{OBJECT_PRONOUN})([.!]?)$", re.IGNORECASE)),
+    # ... and back
+    ("passive", re.compile(rf"^({NOUN_PHRASE}|{PRONOUN})\s+(was|were)\s+(\w+)\s+by\s+({NOUN_PHRASE}|{OBJECT_PRONOUN})([.!]?)$", re.IGNORECASE)),
+)
+PHRASE_PATTERNS = (
+    # "the teachers and the students" -> "the students and the teachers"
+    ("pair", re.compile(rf"\b({DETERMINER}\s+\w+)(\s+and\s+)({DETERMINER}\s+\w+)\b(?!['’-])", re.IGNORECASE)),
+    # "the teachers and students" -> "the students and teachers" (not after a/an, whose form depends on the noun)
+    ("pair", re.compile(rf"\b((?:the|these|those|my|your|his|her|its|our|their|both)\s+)(\w+)(\s+and\s+)(\w+)\b(?!['’-])", re.IGNORECASE)),
+    # "We moved to Leeds in 2019." -> "In 2019, we moved to Leeds."
+    ("trailing", re.compile(rf"^({CLAUSE})\s+({TIME_PHRASE})([.!]?)$")),
+    # "In 2019, we moved to Leeds." -> "We moved to Leeds in 2019."
+    ("leading", re.compile(rf"^({TIME_PHRASE}),\s+({CLAUSE})([.!]?)$", re.IGNORECASE)),
+)
+
+def _capitalize(text: str) -> str:
+    return text[:1].upper() + text[1:]
+
+def _decapitalize(text: str) -> str:
+    return text[:1].lower() + text[1:]
+
+# Lower-case a clause that stops being the start of the sentence; None when its first word
+# might be a name ("I" stays as it is)
+def _lower_clause(clause: str) -> str:
+    first = clause.split(None, 1)[0]
+    if first == "I" or first.startswith(("I'", "I’")):
+        return clause
+    if first.lower() not in LOWERCASE_STARTERS:
+        return None
+    return _decapitalize(clause)
+
+# Pick one of several alternatives with the sentence's random generator (random.Random or a NumPy Generator)
+def _pick(options: list, rng):
+    return options[min(int(rng.random() * len(options)), len(options) - 1)]
+
+# Move a leading subordinate clause behind the main clause, or a trailing one to the front
+def clause_swap(sentence: str, rng) -> str:
+    for form, pattern in CLAUSE_PATTERNS:
+        match = pattern.match(sentence)
+        if match is None:
+            continue
+        if form == "leading":
+            subordinator, clause, main, end = match.groups()
+            if len(main.split()) < 2:
+                continue
+            return f"{_capitalize(main)} {subordinator.lower()} {clause}{end}"
+        main, subordinator, clause, end = match.groups()
+        main_words = main.split()
+        if len(main_words) < 2 or main_words[-1].lower() in COMPLEMENT_VERBS:
+            continue
+        lowered = _lower_clause(main)
+        if lowered is not None:
+            return f"{_capitalize(subordinator)} {clause}, {lowered}{end}"
+    return None
+
+# Noun phrase or pronoun in the other role: subject pronouns become object pronouns and back, and a
+# determiner is lower-cased or capitalised to fit its new position
+def _swap_role(phrase: str, pronouns: dict, first: bool) -> str:
+    pronoun = pronouns.get(phrase.lower())
+    if pronoun is not None:
+        phrase = "I" if pronoun == "i" else pronoun
+    elif phrase != "I":
+        phrase = _decapitalize(phrase)
+    return _capitalize(phrase) if first else phrase
+
+def _is_plural(phrase: str) -> bool:
+    words = phrase.lower().split()
+    if len(words) == 1:
+        return words[0] in PLURAL_PRONOUNS
+    if words[0] in ("these", "those"):
+        return True
+    head = words[-1]
+    return head.endswith("s") and not head.endswith(("ss", "us", "is")) and head not in SINGULAR_NOUNS
+
+def _participle(verb: str) -> str:
+    word = verb.lower()
+    if word in PARTICIPLES:
+        return PARTICIPLES[word]
+    if len(word) > 4 and word.endswith("ed") and word not in NOT_PAST_TENSES:
+        return word
+    return None
+
+def _past_tense(participle: str) -> str:
+    word = participle.lower()
+    if word in PAST_TENSES:
+        return PAST_TENSES[word]
+    if len(word) > 4 and word.endswith("ed") and word not in NOT_PAST_TENSES:
+        return word
+    return None
+
+# Turn "<subject> <past tense> <object>." into the passive ("<object> was <participle> by <subject>."),
+# and a sentence of that passive form back into the active
+def passive(sentence: str, rng) -> str:
+    for form, pattern in VOICE_PATTERNS:
+        match = pattern.match(sentence)
+        if match is None:
+            continue
+        if form == "active":
+            subject, verb, obj, end = match.groups()
+            participle = _participle(verb)
+            # A pronoun subject has to be a subject pronoun ("her report" is a noun phrase, "her" alone isn't)
+            if participle is None or (" " not in subject and subject.lower() not in OBJECT_PRONOUNS):
+                continue
+            new_subject = _swap_role(obj, SUBJECT_PRONOUNS, first=True)
+            auxiliary = "were" if _is_plural(new_subject) else "was"
+            return f"{new_subject} {auxiliary} {participle} by {_swap_role(subject, OBJECT_PRONOUNS, first=False)}{end}"
+        subject, _, participle, agent, end = match.groups()
+        past = _past_tense(participle)
+        if past is None:
+            continue
+        return f"{_swap_role(agent, SUBJECT_PRONOUNS, first=True)} {past} {_swap_role(subject, OBJECT_PRONOUNS, first=False)}{end}"
+    return None
+
+# Phrase-level rules: swap two coordinated nouns ("the staff and students"), or move a time phrase
+# ("in 2019", "last year") between the start and the end of the sentence
+def phrase(sentence: str, rng) -> str:
+    options = []
+    for form, pattern in PHRASE_PATTERNS:
+        if form == "pair":
+            for match in pattern.finditer(sentence):
+                if len(match.groups()) == 3:
+                    first, joiner, second = match.groups()
+                    prefix = ""
+                else:
+                    prefix, first, joiner, second = match.groups()
+                    if first.lower() in FUNCTION_WORDS or second.lower() in FUNCTION_WORDS:
+                        continue
+                if first.lower() == second.lower():
+                    continue
+                # At the start of the sentence the two determiners swap case ("The staff and the students")
+                if match.start() == 0 and not prefix:
+                    first, second = _decapitalize(first), _capitalize(second)
+                options.append(sentence[:match.start()] + prefix + second + joiner + first + sentence[match.end():])
+            continue
+        match = pattern.match(sentence)
+        if match is None:
+            continue
+        if form == "trailing":
+            main, time_phrase, end = match.groups()
+            lowered = _lower_clause(main)
+            if lowered is not None and len(main.split()) >= 2:
+                options.append(f"{_capitalize(time_phrase)}, {lowered}{end}")
+        else:
+            time_phrase, main, end = match.groups()
+            if len(main.split()) >= 2:
+                options.append(f"{_capitalize(main)} {_decapitalize(time_phrase)}{end}")
+    return _pick(options, rng) if options else None
+
+# The old behaviour: shuffle every word of the sentence, leaving the punctuation where it was.
+# Not in the defaults, as the result rarely reads as a sentence.
+def shuffle(sentence: str, rng) -> str:
+    matches = list(WORD_RE.finditer(sentence))
+    if len(matches) < 2:
+        return None
+    keys = [rng.random() for _ in matches]
+    order = sorted(range(len(matches)), key=keys.__getitem__)
+    pieces = []
+    position = 0
+    for match, index in zip(matches, order):
+        pieces.append(sentence[position:match.start()])
+        pieces.append(matches[index].group())
+        position = match.end()
+    pieces.append(sentence[position:])
+    return "".join(pieces)
+
+# Every strategy by name; each takes a sentence and a random generator and returns the reordered
+# sentence, or None when it doesn't apply
+STRATEGIES = {
+    "clause_swap": clause_swap,
+    "passive": passive,
+    "phrase": phrase,
+    "shuffle": shuffle,
+}
+
+# The strategies a document's sentences go through. Each sentence tries them in a random order and
+# takes the first that applies; sentences none of them fit are left as they were. The time each
+# strategy takes is added to stats as reorder_<name>_seconds next to reorder_<name>_sentences (the
+# sentences it was tried on), so the cost per sentence is one over the other. With a budget, a
+# strategy is skipped once its average cost would take the sentences past it (counted in reorder_skipped).
+class ReorderPipeline:
+    def __init__(self, names: tuple = None, budget: float = None) -> None:
+        names = REORDER_STRATEGIES if names is None else names
+        unknown = [name for name in names if name not in STRATEGIES]
+        if unknown:
+            raise ValueError(f"unknown reorder strategies {', '.join(unknown)} (expected some of {', '.join(STRATEGIES)})")
+        self.strategies = [(name, STRATEGIES[name]) for name in names]
+        # Seconds these sentences may spend reordering (None = no limit), and spent so far
+        self.budget = budget
+        self.spent = 0.0
+        # name -> [seconds, sentences tried]
+        self.costs = {name: [0.0, 0] for name in names}
+
+    def apply(self, sentence: str, rng, stats: dict = None) -> str:
+        count = len(self.strategies)
+        if not count:
+            return sentence
+        first = min(int(rng.random() * count), count - 1)
+        for offset in range(count):
+            name, strategy = self.strategies[(first + offset) % count]
+            cost = self.costs[name]
+            if self.budget is not None and self.spent + (cost[0] / cost[1] if cost[1] else 0.0) >= self.budget:
+                if stats is not None:
+                    stats["reorder_skipped"] = stats.get("reorder_skipped", 0) + 1
+                continue
+            started = time.perf_counter()
+            result = strategy(sentence, rng)
+            elapsed = time.perf_counter() - started
+            self.spent += elapsed
+            cost[0] += elapsed
+            cost[1] += 1
+            if stats is not None:
+                stats["reorder_seconds"] = stats.get("reorder_seconds", 0) + elapsed
+                stats[f"reorder_{name}_seconds"] = stats.get(f"reorder_{name}_seconds", 0) + elapsed
+                stats[f"reorder_{name}_sentences"] = stats.get(f"reorder_{name}_sentences", 0) + 1
+                if result is not None:
+                    stats[f"reorder_{name}_applied"] = stats.get(f"reorder_{name}_applied", 0) + 1
+            if result is not None:
+                return result
+        return sentence
+
+if __name__ == "__main__":
+    # Try the strategies on sentences given as arguments (or read from stdin, one per line)
+    import sys
+    import random
+
+    rng = random.Random(0)
+    for line in sys.argv[1:] or sys.stdin.read().splitlines():
+        for name, strategy in STRATEGIES.items():
+            result = strategy(line, rng)
+            if result is not None:
+                print(f"{name:12} {result}")
@@ -0,0 +1,428 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import random  # For introducing randomness in text rewriting
+from lexicon import get_lexicon
+from tokenizer import find_units, match_case, sentence_spans
+from reorder import ReorderPipeline, REORDER_STRATEGIES, REORDER_BUDGET_MS
+from traversal import open_document, iter_text_nodes, set_text, merge_runs
+from fingerprints import group_paragraphs, paragraph_fingerprint, text_fingerprint
+from similarity import paragraph_overlaps, combine_overlaps
+from xml_rewriter import rewrite_docx_xml
+
+# Chance of replacing a word with its synonym, and of reordering a sentence (see reorder.py)
+REPLACE_PROBABILITY = 0.3
+REORDER_PROBABILITY = 0.2
+
+# Rewrite engine: "xml" edits text nodes directly with lxml, "docx" goes through python-docx
+ENGINE = os.getenv("REWRITE_ENGINE", "xml")
+
+# Worker processes used to rewrite a single large document (1 = rewrite in-process)
+PARALLEL_WORKERS = int(os.getenv("REWRITE_PARALLEL_WORKERS", "1"))
+# Documents with fewer text runs than this are always rewritten in-process
+PARALLEL_MIN_RUNS = int(os.getenv("REWRITE_PARALLEL_MIN_RUNS", "2000"))
+# Rewrite each chunk with the NumPy batch rewriter (batch.py) instead of sentence by sentence
+BATCH = os.getenv("REWRITE_BATCH", "0") == "1"
+# Extra rewrite passes allowed when aiming for a target similarity
+MAX_PASSES = int(os.getenv("REWRITE_MAX_PASSES", "5"))
+# With a reference corpus index (CORPUS_INDEX_DIR), only rewrite the paragraphs that overlap it
+CORPUS_FOCUS = os.getenv("CORPUS_FOCUS", "0") == "1"
+# Merge adjacent runs with identical formatting before rewriting .docx files
+MERGE_RUNS = os.getenv("REWRITE_MERGE_RUNS", "1") == "1"
+# Runs per chunk; fixed so a seeded rewrite gives the same output for any worker count
+CHUNK_SIZE = 500
+
+# Settings that change the rewrite output (used to key cached results)
+def rewrite_settings() -> dict:
+    lexicon = get_lexicon()
+    index = reference_index()
+    return {
+        "replace_probability": REPLACE_PROBABILITY,
+        "reorder_probability": REORDER_PROBABILITY,
+        "reorder_strategies": REORDER_STRATEGIES,
+        # A time budget makes the output depend on timing; keyed so results made under another budget aren't reused
+        "reorder_budget_ms": REORDER_BUDGET_MS,
+        "chunk_size": CHUNK_SIZE,
+        "engine": ENGINE,
+        "batch": BATCH,
+        "merge_runs": MERGE_RUNS,
+        # Only used with a target, but a cached result made with a different pass limit would differ
+        "max_passes": MAX_PASSES,
+        "lexicon": lexicon.digest,
+        # The corpus decides which paragraphs are rewritten (CORPUS_FOCUS) and the overlaps reported with
+        # a result, so a changed index must not be answered from the cache
+        "corpus": index.version if index is not None else None,
+        "corpus_focus": CORPUS_FOCUS if index is not None else None,
+        "overlap_threshold": _overlap_threshold() if index is not None else None,
+    }
+
+# CORPUS_OVERLAP_THRESHOLD, imported from corpus_index (and NumPy with it) only once an index is configured
+def _overlap_threshold() -> float:
+    from corpus_index import OVERLAP_THRESHOLD
+
+    return OVERLAP_THRESHOLD
+
+# The reference corpus index, or None when CORPUS_INDEX_DIR is unset. corpus_index (and NumPy with it)
+# is only imported once an index is configured.
+def reference_index():
+    if not os.getenv("CORPUS_INDEX_DIR"):
+        return None
+    from corpus_index import get_index
+
+    return get_index()
+
+# Load what the first document would otherwise wait for: the lexicon and its digest, python-docx for the docx engine,
+# and NumPy and the corpus index when they are in use. Called by the optional pre-warm hook and in
+# each worker process as it starts.
+def warm_up() -> None:
+    # The digest keys cached results; hashing a large lexicon takes a while too
+    get_lexicon().digest
+    if ENGINE == "docx":
+        import docx
+    if BATCH:
+        import batch
+    reference_index()
+
+# Default seed for a job: derived from the document's content, so the same file gives the same
+# rewrite (and the same cache entry) until the user asks for a different seed
+def job_seed(data: bytes) -> int:
+    return int.from_bytes(hashlib.sha256(data).digest()[:6], "big")
+
+# Same as job_seed, for a file on disk
+def file_seed(path: str) -> int:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return int.from_bytes(h.digest()[:6], "big")
+
+# Process a .docx with the configured engine. If `previous` (paragraph fingerprint -> rewritten texts,
+# see fingerprints.py) is given, unchanged paragraphs reuse that output and every paragraph's
+# rewrite is returned in stats["paragraphs"]. The similarity to the original is returned in
+# stats["similarity"]; `target` keeps rewriting until it is at most that (see rewrite_nodes).
+def process_document(
+    source,
+    output=None,
+    seed: int = None,
+    workers: int = None,
+    stats: dict = None,
+    previous: dict = None,
+    target: float = None,
+):
+    process = process_docx if ENGINE == "docx" else process_docx_xml
+    return process(source, output, seed=seed, workers=workers, stats=stats, previous=previous, target=target)
+
+# Fast path: rewrite the text nodes with lxml and stream every other zip member through unchanged
+def process_docx_xml(
+    source,
+    output=None,
+    seed: int = None,
+    workers: int = None,
+    stats: dict = None,
+    previous: dict = None,
+    target: float = None,
+):
+    if output is None:
+        output = f"processed_{os.path.basename(source)}"
+    rewrite_docx_xml(
+        source,
+        output,
+        lambda nodes: rewrite_nodes(nodes, seed=seed, workers=workers, stats=stats, previous=previous, target=target),
+        stats=stats,
+        merge=MERGE_RUNS,
+    )
+    return output
+
+# Process the .docx file (source and output can be paths or binary streams).
+# If a stats dict is given, stage timings and word counts are added to it.
+def process_docx(
+    source,
+    output=None,
+    seed: int = None,
+    workers: int = None,
+    stats: dict = None,
+    previous: dict = None,
+    target: float = None,
+):
+    stats = {} if stats is None else stats
+
+    # Read the .docx file
+    started = time.perf_counter()
+    doc = open_document(source)
+    stats["parse_seconds"] = time.perf_counter() - started
+
+    # Collect the text of every run in the body, tables, text boxes, headers, footers and notes
+    started = time.perf_counter()
+    nodes = list(iter_text_nodes(doc))
+
+    # Coalesce runs Word split without a formatting change, so words and phrases aren't cut in two
+    if MERGE_RUNS:
+        nodes, stats["runs_merged"] = merge_runs(nodes)
+
+    # Rewrite the text in place (in parallel for large documents); formatting, images,
+    # sections and styles are untouched because only the text nodes change
+    rewritten = rewrite_nodes(nodes, seed=seed, workers=workers, stats=stats, previous=previous, target=target)
+    for node, text in zip(nodes, rewritten):
+        set_text(node, text)
+    stats["rewrite_seconds"] = time.perf_counter() - started
+
+    # Save the rewritten document (next to the working directory by default)
+    started = time.perf_counter()
+    if output is None:
+        output = f"processed_{os.path.basename(source)}"
+    doc.save(output)
+    stats["save_seconds"] = time.perf_counter() - started
+
+    return output
+
+# Rewrite the text of many <w:t> nodes, returning the new texts in order (see rewrite_runs)
+def rewrite_nodes(
+    nodes: list,
+    seed: int = None,
+    workers: int = None,
+    stats: dict = None,
+    previous: dict = None,
+    target: float = None,
+) -> list:
+    return rewrite_runs(
+        [node.text or "" for node in nodes],
+        group_paragraphs(nodes),
+        seed=seed,
+        workers=workers,
+        stats=stats,
+        previous=previous,
+        target=target,
+        fingerprint=lambda indices: paragraph_fingerprint(nodes, indices),
+    )
+
+# The rewrite engine shared by every document format: rewrite run texts grouped into paragraphs
+# (lists of run indices), returning the new texts in order. With `previous`, paragraphs whose
+# fingerprint is already there are copied from it and only the rest are rewritten. With `target`,
+# paragraphs still more similar to the original than that (0-1) are rewritten again, up to MAX_PASSES
+# times. Paragraphs overlapping the reference corpus are listed in stats["overlaps"]. Reordering is held
+# to REORDER_BUDGET_MS per document; `reorder_spent` is the time earlier batches of the same document
+# already took (see formats.RewriteJob).
+def rewrite_runs(
+    texts: list,
+    paragraphs: list,
+    seed: int = None,
+    workers: int = None,
+    stats: dict = None,
+    previous: dict = None,
+    target: float = None,
+    fingerprint=None,
+    reorder_spent: float = 0.0,
+) -> list:
+    stats = {} if stats is None else stats
+    # Reordering time the document has left in seconds (None = no limit), after what the rewrites so far spent
+    def budget():
+        if REORDER_BUDGET_MS <= 0:
+            return None
+        return REORDER_BUDGET_MS / 1000 - reorder_spent - stats.get("reorder_seconds", 0)
+
+    fingerprint = fingerprint or (lambda indices: text_fingerprint([texts[i] for i in indices]))
+    originals = ["".join(texts[i] for i in indices) for indices in paragraphs]
+
+    # Check the paragraphs against the reference corpus; in focus mode only overlapping ones are rewritten
+    selected = [True] * len(paragraphs)
+    corpus = reference_index()
+    if corpus is not None:
+        from corpus_index import OVERLAP_THRESHOLD
+
+        started = time.perf_counter()
+        overlaps = corpus.overlaps(originals)
+        stats["check_seconds"] = time.perf_counter() - started
+        stats["overlaps"] = [
+            (number, fraction, source)
+            for number, (fraction, source) in enumerate(overlaps, 1)
+            if fraction >= OVERLAP_THRESHOLD
+        ]
+        if CORPUS_FOCUS:
+            selected = [fraction >= OVERLAP_THRESHOLD for fraction, _ in overlaps]
+
+    if previous is None and all(selected):
+        rewritten = rewrite_texts(texts, seed=seed, workers=workers, stats=stats, budget=budget())
+    else:
+        rewritten = list(texts)
+        if previous is not None:
+            fingerprints = [fingerprint(indices) for indices in paragraphs]
+        changed = []
+        reused = 0
+        for number, indices in enumerate(paragraphs):
+            if not selected[number]:
+                continue
+            earlier = previous.get(fingerprints[number]) if previous is not None else None
+            if earlier is not None and len(earlier) == len(indices):
+                for index, text in zip(indices, earlier):
+                    rewritten[index] = text
+                reused += 1
+            else:
+                changed.extend(indices)
+
+        # Rewrite the new and edited paragraphs together so they're still chunked (and parallelised) as usual
+        for index, text in zip(changed, rewrite_texts([texts[i] for i in changed], seed=seed, workers=workers, stats=stats, budget=budget())):
+            rewritten[index] = text
+        if previous is not None:
+            stats["paragraphs_reused"] = reused
+
+    # Measure how much each paragraph changed, and rewrite the ones still too close to the original
+    overlaps = [None] * len(paragraphs)
+    similarity, scores = score_rewrite(originals, paragraphs, rewritten, stats, overlaps)
+    passes = 0
+    while target is not None and similarity > target and passes < MAX_PASSES:
+        again = [
+            number
+            for number, (score, chosen) in enumerate(zip(scores, selected))
+            if chosen and score is not None and score > target
+        ]
+        if not again:
+            break
+        passes += 1
+        changed = [index for number in again for index in paragraphs[number]]
+        pass_seed = None if seed is None else f"{seed}:pass{passes}"
+        for index, text in zip(changed, rewrite_texts([rewritten[i] for i in changed], seed=pass_seed, workers=workers, stats=stats, budget=budget())):
+            rewritten[index] = text
+        # Only the paragraphs rewritten again can have changed
+        similarity, scores = score_rewrite(originals, paragraphs, rewritten, stats, overlaps, again)
+
+    stats["similarity"] = similarity
+    stats["paragraph_similarity"] = scores
+    stats["passes"] = passes
+
+    if previous is not None:
+        # Every rewritten paragraph of this document, so reused ones count as recently used again
+        stats["paragraphs"] = {
+            fingerprint: [rewritten[i] for i in indices]
+            for fingerprint, indices, chosen in zip(fingerprints, paragraphs, selected)
+            if chosen
+        }
+    return rewritten
+
+# Similarity of the rewritten paragraphs to the originals. `overlaps` holds each paragraph's shingle counts
+# (see similarity.paragraph_overlaps) and only the paragraphs numbered in `numbers` (all when None) are
+# compared again; the time taken is added to stats["score_seconds"].
+def score_rewrite(originals: list, paragraphs: list, rewritten: list, stats: dict, overlaps: list, numbers: list = None) -> tuple:
+    started = time.perf_counter()
+    numbers = range(len(paragraphs)) if numbers is None else numbers
+    updated = paragraph_overlaps(
+        [originals[number] for number in numbers],
+        ["".join(rewritten[i] for i in paragraphs[number]) for number in numbers],
+    )
+    for number, overlap in zip(numbers, updated):
+        overlaps[number] = overlap
+    result = combine_overlaps(overlaps)
+    stats["score_seconds"] = stats.get("score_seconds", 0) + time.perf_counter() - started
+    return result
+
+# Rewrite many run texts, returning them in the original order. `budget` is the time reordering may
+# take over all of them in seconds (None = no limit); each chunk gets a share in proportion to its runs.
+def rewrite_texts(texts: list, seed: int = None, workers: int = None, stats: dict = None, budget: float = None) -> list:
+    workers = PARALLEL_WORKERS if workers is None else workers
+
+    # Split into fixed-size chunks, each with its own seed derived from the job seed
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    seeds = [None if seed is None else f"{seed}:{i}" for i in range(len(chunks))]
+    budgets = [None if budget is None else budget * len(chunk) / len(texts) for chunk in chunks]
+
+    if workers > 1 and len(chunks) > 1 and len(texts) >= PARALLEL_MIN_RUNS:
+        # Load the lexicon before the pool forks so workers share it instead of re-reading the file
+        get_lexicon()
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=get_lexicon) as pool:
+            results = list(pool.map(rewrite_chunk, chunks, seeds, budgets))
+    else:
+        results = map(rewrite_chunk, chunks, seeds, budgets)
+
+    rewritten = []
+    for chunk, chunk_stats in results:
+        rewritten.extend(chunk)
+        if stats is not None:
+            for name, count in chunk_stats.items():
+                stats[name] = stats.get(name, 0) + count
+    return rewritten
+
+# Rewrite one chunk of run texts (runs in a worker process in parallel mode);
+# returns the rewritten texts and the chunk's word counts. Each chunk draws from its own
+# random.Random, so concurrent jobs in threads never share (or reseed) the global generator.
+def rewrite_chunk(texts: list, seed: str = None, budget: float = None) -> tuple:
+    if BATCH:
+        return rewrite_chunk_batch(texts, seed, budget)
+    rng = random.Random(seed)
+    reorder = ReorderPipeline(budget=budget)
+    stats = {"words": 0, "words_replaced": 0}
+    # Whitespace-only runs are kept as-is so the spacing between runs survives
+    return [rewrite_text(text, stats, rng, reorder) if text.strip() else text for text in texts], stats
+
+# Same as rewrite_chunk, but all the chunk's texts go through batch.rewrite_batch in one call.
+# The output differs from the sentence-by-sentence path for the same seed (the random draws are made in
+# a different order), but it follows the same rules and is just as reproducible.
+def rewrite_chunk_batch(texts: list, seed: str = None, budget: float = None) -> tuple:
+    import numpy as np
+    from batch import rewrite_batch
+
+    if seed is None:
+        rng = np.random.default_rng()
+    else:
+        rng = np.random.default_rng(int.from_bytes(hashlib.sha256(seed.encode()).digest()[:8], "little"))
+    stats = {"words": 0, "words_replaced": 0}
+    reorder = ReorderPipeline(budget=budget)
+    return rewrite_batch(texts, rng, REPLACE_PROBABILITY, REORDER_PROBABILITY, reorder, stats), stats
+
+# Advanced rule-based text rewriting
+def rewrite_text(text: str, stats: dict = None, rng: random.Random = None, reorder: ReorderPipeline = None) -> str:
+    rng = rng or random.Random()
+    reorder = reorder or ReorderPipeline()
+
+    # Rewrite each sentence, keeping the whitespace between sentences exactly as it was
+    pieces = []
+    position = 0
+    for start, end in sentence_spans(text):
+        pieces.append(text[position:start])
+        pieces.append(rewrite_sentence(text[start:end], stats, rng, reorder))
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+# Rewrite a single sentence
+def rewrite_sentence(sentence: str, stats: dict = None, rng: random.Random = None, reorder: ReorderPipeline = None) -> str:
+    rng = rng or random.Random()
+
+    # Split the sentence into words and lexicon phrases, keeping the punctuation and spacing between them
+    units = find_units(sentence, get_lexicon())
+
+    # Apply rewriting rules
+    rewritten_words = []
+    replaced = 0
+    for start, end, synonym in units:
+        word = sentence[start:end]
+        # Randomly replace words (and phrases like "hard work") with synonyms
+        if synonym is not None and rng.random() < REPLACE_PROBABILITY:  # 30% chance to replace a word
+            rewritten_words.append(match_case(word, synonym))
+            replaced += 1
+        else:
+            rewritten_words.append(word)
+
+    # Count words seen and replaced (for metrics)
+    if stats is not None:
+        stats["words"] += len(units)
+        stats["words_replaced"] += replaced
+
+    # Put the words back between the original separators
+    pieces = []
+    position = 0
+    for (start, end, _), word in zip(units, rewritten_words):
+        pieces.append(sentence[position:start])
+        pieces.append(word)
+        position = end
+    pieces.append(sentence[position:])
+    rewritten = "".join(pieces)
+
+    # Randomly restructure the sentence (swap clauses, change voice, move phrases); sentences none of
+    # the strategies fit stay as they are
+    if rng.random() < REORDER_PROBABILITY:  # 20% chance to reorder a sentence
+        rewritten = (reorder or ReorderPipeline()).apply(rewritten, rng, stats)
+    return rewritten
+
+# Get a synonym for a word from the shared lexicon (loaded once from synonyms.tsv)
+def get_synonym(word: str) -> str:
+    return get_lexicon().get(word.lower(), word)
@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+
+# Raised when a job is refused before anything is downloaded; the message is shown to the user
+class AdmissionError(Exception):
+    pass
+
+# Per-user byte budget that refills continuously (token bucket)
+class ByteBucket:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        # The full capacity refills over one minute
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    # Seconds until `size` bytes would be available
+    def wait_time(self, size: int) -> float:
+        self._refill()
+        return max(0.0, (size - self.tokens) * 60 / self.capacity)
+
+    def take(self, size: int) -> None:
+        self._refill()
+        self.tokens -= size
+
+    # Give back bytes taken for a job that never ran
+    def give(self, size: int) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + size)
+
+# A place in the queue; `async with ticket:` waits for the job's turn and frees the slot afterwards
+class Ticket:
+    def __init__(self, scheduler: "FairScheduler", user_id: int, size: int) -> None:
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.size = size
+        self.granted = asyncio.get_running_loop().create_future()
+        self.released = False
+        self.refunded = False
+
+    # Jobs that will start before this one
+    @property
+    def position(self) -> int:
+        return self.scheduler.position(self)
+
+    async def __aenter__(self) -> "Ticket":
+        try:
+            await self.granted
+        except asyncio.CancelledError:
+            self.scheduler.discard(self)
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.scheduler.release(self)
+
+# Admission control and a job queue that takes turns between users, so one heavy sender
+# can't starve everyone else
+class FairScheduler:
+    def __init__(
+        self,
+        max_running: int,
+        max_queued: int = 100,
+        user_max_running: int = 1,
+        user_max_queued: int = 3,
+        user_bytes_per_minute: int = 50 * 1024 * 1024,
+        max_file_size: int = 20 * 1024 * 1024,
+    ) -> None:
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.user_max_running = user_max_running
+        self.user_max_queued = user_max_queued
+        self.user_bytes_per_minute = user_bytes_per_minute
+        self.max_file_size = max_file_size
+
+        # user -> waiting tickets; the order of users is the round-robin order
+        self.queues = OrderedDict()
+        self.running = {}
+        self.buckets = {}
+
+    # Build a scheduler from MAX_RUNNING_JOBS, MAX_QUEUED_JOBS, USER_MAX_RUNNING, USER_MAX_QUEUED,
+    # USER_BYTES_PER_MINUTE and MAX_FILE_SIZE
+    @classmethod
+    def from_env(cls, default_max_running: int) -> "FairScheduler":
+        return cls(
+            max_running=int(os.getenv("MAX_RUNNING_JOBS", str(default_max_running))),
+            max_queued=int(os.getenv("MAX_QUEUED_JOBS", "100")),
+            user_max_running=int(os.getenv("USER_MAX_RUNNING", "1")),
+            user_max_queued=int(os.getenv("USER_MAX_QUEUED", "3")),
+            user_bytes_per_minute=int(os.getenv("USER_BYTES_PER_MINUTE", str(50 * 1024 * 1024))),
+            max_file_size=int(os.getenv("MAX_FILE_SIZE", str(20 * 1024 * 1024))),
+        )
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    @property
+    def total_running(self) -> int:
+        return sum(self.running.values())
+
+    # Check limits and queue a job; raises AdmissionError before the file is downloaded
+    def submit(self, user_id: int, size: int) -> Ticket:
+        size = size or 0
+        if size > self.max_file_size:
+            raise AdmissionError(f"This file is too large. The limit is {self.max_file_size / (1024 * 1024):.0f} MB.")
+        # A file bigger than the per-minute allowance would never fit in the bucket, however long the user waits
+        if size > self.user_bytes_per_minute:
+            raise AdmissionError(
+                f"This file is too large. The limit is {self.user_bytes_per_minute / (1024 * 1024):.0f} MB per minute."
+            )
+        if len(self.queues.get(user_id, ())) >= self.user_max_queued:
+            raise AdmissionError("You already have several files waiting. Please wait for them to finish.")
+        if self.queued >= self.max_queued:
+            raise AdmissionError("The bot is busy right now. Please try again in a few minutes.")
+
+        bucket = self.buckets.setdefault(user_id, ByteBucket(self.user_bytes_per_minute))
+        wait = bucket.wait_time(size)
+        if wait > 0:
+            raise AdmissionError(f"You're sending files too quickly. Please try again in {wait:.0f} seconds.")
+        bucket.take(size)
+
+        ticket = Ticket(self, user_id, size)
+        self.queues.setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    # An extra slot for a job that is already running and can use more than one worker (an archive's
+    # documents), granted at once if a slot is free and no other job is waiting for it; None otherwise.
+    # The slot counts as one of the user's running jobs until released (`async with` or release()).
+    def claim(self, user_id: int) -> Ticket:
+        if self.queues or self.total_running >= self.max_running:
+            return None
+        ticket = Ticket(self, user_id, 0)
+        self.running[user_id] = self.running.get(user_id, 0) + 1
+        ticket.granted.set_result(None)
+        return ticket
+
+    # Start queued jobs while there are free slots, taking one job per user in turn
+    def _dispatch(self) -> None:
+        while self.total_running < self.max_running:
+            for user_id, queue in self.queues.items():
+                if self.running.get(user_id, 0) < self.user_max_running:
+                    break
+            else:
+                return
+
+            ticket = queue.popleft()
+            # Move the user to the back of the round-robin order
+            if queue:
+                self.queues.move_to_end(user_id)
+            else:
+                del self.queues[user_id]
+
+            self.running[user_id] = self.running.get(user_id, 0) + 1
+            ticket.granted.set_result(None)
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        self.running[ticket.user_id] -= 1
+        if not self.running[ticket.user_id]:
+            del self.running[ticket.user_id]
+        self._dispatch()
+
+    # Drop a ticket that won't be used: remove it from the queue, or give back its slot if it
+    # was already granted. A ticket that never got its turn also gets its bytes back. Safe to call
+    # on a ticket that has finished normally.
+    def discard(self, ticket: Ticket) -> None:
+        queue = self.queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket.user_id]
+            self.refund(ticket)
+        elif ticket.granted.done() and not ticket.granted.cancelled():
+            self.release(ticket)
+        else:
+            ticket.granted.cancel()
+            self.refund(ticket)
+
+    # Give back the bytes charged for a job that never ran (dropped while queued, or refused by a
+    # full worker pool), so the user isn't rate-limited for it when they send the file again
+    def refund(self, ticket: Ticket) -> None:
+        if ticket.refunded or ticket.user_id not in self.buckets:
+            return
+        ticket.refunded = True
+        self.buckets[ticket.user_id].give(ticket.size)
+
+    # 1-based place of a ticket in the queue (0 once it's running). Users ahead of this one in
+    # the round-robin order get one more turn than users behind it.
+    def position(self, ticket: Ticket) -> int:
+        queue = self.queues.get(ticket.user_id)
+        if not queue or ticket not in queue:
+            return 0
+        index = queue.index(ticket)
+        ahead = index
+        turns = index + 1
+        for user_id, other in self.queues.items():
+            if user_id == ticket.user_id:
+                turns = index
+            else:
+                ahead += min(len(other), turns)
+        return ahead + 1
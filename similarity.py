@@ -0,0 +1,48 @@
+from tokenizer import WORD_RE
+
+# Words per shingle: 3-word sequences catch both replaced words and reordered sentences
+SHINGLE_SIZE = 3
+
+# The set of overlapping word n-grams in a text (case-insensitive, punctuation ignored).
+# Texts shorter than one shingle become a single shingle of all their words.
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return set(zip(*(words[i:] for i in range(size))))
+
+# Compare original and rewritten paragraphs with the Jaccard similarity of their shingle sets (1.0 = same
+# wording, 0.0 = nothing in common); returns (document similarity, similarity per paragraph). The document
+# score is the Jaccard similarity over all paragraphs' shingles, each kept apart by paragraph, i.e.
+# shared shingles / all shingles summed over the paragraphs. Paragraphs with no words score None.
+def score_paragraphs(originals: list, rewritten: list) -> tuple:
+    return combine_overlaps(paragraph_overlaps(originals, rewritten))
+
+# (shared shingles, all shingles) of each original and rewritten paragraph, None for paragraphs with no
+# words. Kept per paragraph so a document can be re-scored after rewriting only some of its paragraphs.
+def paragraph_overlaps(originals: list, rewritten: list) -> list:
+    overlaps = []
+    for original, text in zip(originals, rewritten):
+        a = shingles(original)
+        b = shingles(text)
+        if not a and not b:
+            overlaps.append(None)
+            continue
+        common = len(a & b)
+        overlaps.append((common, len(a) + len(b) - common))
+    return overlaps
+
+# (document similarity, similarity per paragraph) from paragraph_overlaps' counts
+def combine_overlaps(overlaps: list) -> tuple:
+    scores = []
+    shared = 0
+    total = 0
+    for overlap in overlaps:
+        if overlap is None:
+            scores.append(None)
+            continue
+        common, union = overlap
+        shared += common
+        total += union
+        scores.append(common / union)
+    return (shared / total if total else 1.0), scores
@@ -0,0 +1,136 @@
+import re
+
+# A word is a run of letters/digits, optionally joined by apostrophes or hyphens ("don't", "self-control")
+WORD_RE = re.compile(r"\w+(?:['’-]\w+)*")
+
+# Where a sentence can end: after ., ?, ! or … (and any closing quotes or brackets) when whitespace
+# follows, and after the last character before a line break. Group 1 is the whitespace that follows
+# and group 2 the first character after it (empty at the end of the text).
+BOUNDARY_RE = re.compile(r"(?:[.?!…]+[\"'”’)\]]*|(?<=\S)(?=[^\S\n]*\n))(\s+)(\S?)")
+NON_SPACE_RE = re.compile(r"\S")
+
+# Words that end in a full stop without ending the sentence (matched lower-case, without the final dot)
+ABBREVIATIONS = frozenset((
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "al", "fig", "figs", "eq",
+    "no", "nos", "vol", "vols", "pp", "p", "ch", "sec", "ed", "eds", "approx", "ca", "cf", "resp",
+    "inc", "ltd", "co", "corp", "dept", "univ", "assoc", "gen", "gov", "jan", "feb", "mar", "apr",
+    "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "e.g", "i.e", "u.s", "u.k", "ph.d",
+))
+
+# (start, end) offsets of the sentences in text, in order. A sentence runs from its first
+# non-whitespace character to its closing punctuation (or the last character before a line
+# break, or the end of the text); the whitespace between sentences is left out, so joining
+# text[previous end:start] + sentence + ... rebuilds the text exactly. Full stops after
+# abbreviations and initials ("Dr.", "e.g.", "J. Smith") and before a lower-case word don't end
+# a sentence. Whitespace-only text has no sentences.
+def sentence_spans(text: str) -> list:
+    first = NON_SPACE_RE.search(text)
+    if first is None:
+        return []
+    spans = []
+    start = first.start()
+    for match in BOUNDARY_RE.finditer(text, start):
+        following = match.group(2)
+        if not following:
+            break
+        end = match.start(1)
+        # A line break always ends the sentence; a full stop on the same line as the next word only
+        # when it doesn't follow an abbreviation and the next word isn't lower case
+        if "\n" not in match.group(1):
+            if following.islower():
+                continue
+            if text[match.start()] == "." and _is_abbreviation(text, start, match.start()):
+                continue
+        spans.append((start, end))
+        start = match.start(2)
+    end = len(text.rstrip())
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+# Whether the word ending at `dot` (inside the sentence starting at `start`) is an abbreviation or initial
+def _is_abbreviation(text: str, start: int, dot: int) -> bool:
+    # Sentences never contain line breaks, so the word starts after the last space or tab
+    begin = max(text.rfind(" ", start, dot), text.rfind("\t", start, dot), start - 1) + 1
+    word = text[begin:dot].lstrip("\"'“‘([").lower()
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+# Split text into word units in a single pass, matching the longest lexicon phrase at each position.
+# Returns (start, end, replacement) spans; replacement is chosen by the lexicon from the words either
+# side of the unit, and is None for words not in the lexicon or when no candidate fits the context.
+# Everything between spans (spaces, punctuation) is left to the caller to keep as-is.
+def find_units(text: str, lexicon) -> list:
+    words = [(m.start(), m.end(), m.group().lower()) for m in WORD_RE.finditer(text)]
+    ids = lexicon.ids
+    phrases = lexicon.phrases
+
+    units = []
+    i = 0
+    while i < len(words):
+        start, end, word = words[i]
+        entry = None
+        length = 1
+
+        # Follow the phrase trie as far as the following words allow; the gap between
+        # words must be plain whitespace so "hard, work" doesn't match "hard work"
+        node = phrases.get(word)
+        j = i
+        while node is not None:
+            if None in node and j > i:
+                entry, length = node[None], j - i + 1
+            if j + 1 >= len(words) or not text[words[j][1]:words[j + 1][0]].isspace():
+                break
+            j += 1
+            node = node.get(words[j][2])
+
+        if length > 1:
+            end = words[i + length - 1][1]
+        else:
+            entry = ids.get(word)
+
+        # Neighbours only count as context when joined by plain whitespace too
+        replacement = None
+        if entry is not None:
+            previous = words[i - 1][2] if i and text[words[i - 1][1]:start].isspace() else None
+            k = i + length
+            following = words[k][2] if k < len(words) and text[end:words[k][0]].isspace() else None
+            replacement = lexicon.choose(entry, previous, following)
+
+        units.append((start, end, replacement))
+        i += length
+
+    return units
+
+# Give a replacement the same capitalisation as the text it replaces
+def match_case(original: str, replacement: str) -> str:
+    if len(original) > 1 and original.isupper():
+        return replacement.upper()
+    if original[:1].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+if __name__ == "__main__":
+    # Quick scaling check: time per word should stay flat as paragraphs grow
+    import time
+    from lexicon import get_lexicon
+
+    lexicon = get_lexicon()
+    sample = "The Student's research, on time management and mental health, was hard work. "
+    for repeat in (10, 100, 1000, 10000):
+        text = sample * repeat
+        started = time.perf_counter()
+        units = find_units(text, lexicon)
+        elapsed = time.perf_counter() - started
+        print(f"{len(units):>7} words: {elapsed * 1000:8.2f} ms ({elapsed / len(units) * 1e9:6.0f} ns/word)")
+
+    # Segmenter throughput on text with abbreviations, questions, quotes and line breaks
+    sample = 'Dr. Smith asked: "Is it done?" It is, e.g. the report. Results rose 3.5% in Jan. 2020!\nNext line. '
+    for repeat in (10, 100, 1000, 10000):
+        text = sample * repeat
+        started = time.perf_counter()
+        spans = sentence_spans(text)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{len(spans):>7} sentences: {elapsed * 1000:8.2f} ms "
+            f"({len(text) / elapsed / 1e6:6.1f} MB/s, {elapsed / len(spans) * 1e9:6.0f} ns/sentence)"
+        )
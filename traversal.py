@@ -0,0 +1,101 @@
+# python-docx is only imported by the functions that need it: it is the slowest import in the bot,
+# and the default XML engine never loads it
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_R = W + "r"
+W_T = W + "t"
+W_RPR = W + "rPr"
+# Spell-check markers Word leaves between runs; they carry no text or formatting
+W_PROOF_ERR = W + "proofErr"
+
+WML_FOOTNOTES = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+WML_ENDNOTES = "application/vnd.openxmlformats-officedocument.wordprocessingml.endnotes+xml"
+
+# Parts holding text the user sees: the body (with its tables and text boxes), headers, footers and notes
+STORY_CONTENT_TYPES = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml",
+    WML_FOOTNOTES,
+    WML_ENDNOTES,
+)
+
+# Open a .docx (path or file object) with python-docx. python-docx has no part class for
+# footnotes/endnotes and keeps them as raw bytes; they are loaded as XML parts so their text can be
+# edited like the rest of the document.
+def open_document(source=None):
+    from docx import Document
+    from docx.opc.part import PartFactory, XmlPart
+
+    for content_type in (WML_FOOTNOTES, WML_ENDNOTES):
+        PartFactory.part_type_for.setdefault(content_type, XmlPart)
+    return Document(source)
+
+# Root XML element of every story part in the document's package, ordered by part name
+def story_elements(doc) -> list:
+    from docx.opc.part import XmlPart
+
+    parts = [
+        part
+        for part in doc.part.package.iter_parts()
+        if part.content_type in STORY_CONTENT_TYPES and isinstance(part, XmlPart)
+    ]
+    return [part.element for part in sorted(parts, key=lambda part: part.partname)]
+
+# Every <w:t> text node across all story parts, in document order. Nested tables, text boxes,
+# hyperlinks and fields are all covered because the whole XML tree is walked.
+def iter_text_nodes(doc):
+    for element in story_elements(doc):
+        yield from element.iter(W_T)
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# Replace a text node's content, keeping leading/trailing spaces that Word would otherwise trim
+def set_text(node, text: str) -> None:
+    node.text = text
+    if text != text.strip():
+        node.set(XML_SPACE, "preserve")
+
+# Merge runs that Word split for no visible reason (spell-check, revision IDs, editing sessions): a run
+# holding only text is folded into the run before it when both have identical formatting and nothing
+# but spell-check markers sits between them. The merged text goes into the first run's text node and
+# the later runs are removed, so edits map straight back to the surviving run. Returns the text nodes
+# that remain (in order) and the number of runs merged away.
+def merge_runs(nodes: list) -> tuple:
+    kept = []
+    merged = 0
+    # Run, text node and formatting of the last run that later runs could merge into
+    previous_run = previous_node = previous_formatting = None
+    for node in nodes:
+        run = node.getparent()
+        if run is None or run.tag != W_R or len(run) > 2 or (len(run) == 2 and run[0].tag != W_RPR):
+            kept.append(node)
+            previous_run = None
+            continue
+
+        # Only compare formatting when the runs are neighbours (the cheap check first)
+        formatting = None
+        if previous_run is not None and _follows(previous_run, run):
+            formatting = _formatting(run)
+            if formatting == previous_formatting:
+                set_text(previous_node, (previous_node.text or "") + (node.text or ""))
+                run.getparent().remove(run)
+                merged += 1
+                continue
+
+        kept.append(node)
+        previous_run, previous_node = run, node
+        previous_formatting = _formatting(run) if formatting is None else formatting
+    return kept, merged
+
+# Comparable form of a run's formatting (its <w:rPr>, which is always the first child)
+def _formatting(run) -> tuple:
+    if len(run) < 2:
+        return ()
+    return tuple((element.tag, tuple(element.attrib.items()), element.text) for element in run[0].iter())
+
+# Whether `run` comes straight after `before`, ignoring spell-check markers
+def _follows(before, run) -> bool:
+    sibling = before.getnext()
+    while sibling is not None and sibling.tag == W_PROOF_ERR:
+        sibling = sibling.getnext()
+    return sibling is run
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Build the aiohttp app that feeds Telegram webhook POSTs into the application's update queue
+def create_webhook_app(application: Application, path: str, secret_token: str = None) -> web.Application:
+    async def receive_update(request: web.Request) -> web.Response:
+        # Telegram echoes the secret back in this header; reject anything that doesn't match
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=403)
+        # Anything that isn't a JSON object with an update ID (or that python-telegram-bot can't read
+        # as an update) is the sender's mistake, not a server error
+        try:
+            data = await request.json()
+            if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+                raise ValueError("not a Telegram update")
+            update = Update.de_json(data, application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(path, receive_update)
+    app.router.add_get("/healthz", health)
+    return app
+
+# Run the bot behind a local webhook listener instead of polling Telegram
+async def run_webhook(
+    application: Application,
+    listen: str,
+    port: int,
+    path: str,
+    webhook_url: str = None,
+    secret_token: str = None,
+) -> None:
+    runner = web.AppRunner(create_webhook_app(application, path, secret_token))
+    await runner.setup()
+
+    # Same lifecycle as run_polling: post_init after initialize, post_shutdown after shutdown
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        # Register the public URL with Telegram; instances behind a load balancer can leave it unset
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+
+        await web.TCPSite(runner, listen, port).start()
+        logger.info("Listening for webhook updates on %s:%d%s", listen, port, path)
+
+        try:
+            # Serve until cancelled (e.g. Ctrl+C)
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)